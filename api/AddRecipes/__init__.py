@@ -0,0 +1,35 @@
+import logging
+import hashlib
+import json
+import azure.functions as func
+
+# Takes a list of `{"hash": ..., "recipe": ...}` rows. The hash is recomputed from the
+# recipe text so a row can never be stored under the wrong key, and as the output binding
+# upserts on the hash, uploading a recipe that is already stored is harmless.
+def main(req: func.HttpRequest, recipes: func.Out[func.SqlRow]) -> func.HttpResponse:
+    logging.info('Python HTTP trigger and SQL output binding function processed a request.')
+
+    try:
+        req_body = req.get_json()
+        rows = func.SqlRowList(
+            func.SqlRow.from_dict({
+                "hash": hashlib.sha256(r["recipe"].encode("utf-8")).hexdigest(),
+                "recipe": r["recipe"]
+            })
+            for r in req_body
+        )
+    except (ValueError, KeyError, TypeError, AttributeError):
+        req_body = None
+
+    if req_body:
+        recipes.set(rows)
+        return func.HttpResponse(
+            body=json.dumps([row["hash"] for row in rows]),
+            status_code=201,
+            mimetype="application/json"
+        )
+    else:
+        return func.HttpResponse(
+            "Error accessing request body",
+            status_code=400
+        )
@@ -1,6 +1,11 @@
 import logging
 import azure.functions as func
 
+# Takes a list of `{"userId": ..., "recipe_hash": ..., "marked_as_preference": ...}` rows.
+# The recipe itself is stored once in [dbo].[recipes] (see AddRecipes), which the bot uploads
+# before the preferences that refer to it. Rows stored before recipe_hash existed still hold
+# the text in `recipe`, so that column is nullable:
+#   ALTER TABLE user_preferences ALTER COLUMN recipe NVARCHAR(MAX) NULL;
 def main(req: func.HttpRequest, preferences: func.Out[func.SqlRow]) -> func.HttpResponse:
     logging.info('Python HTTP trigger and SQL output binding function processed a request.')
 
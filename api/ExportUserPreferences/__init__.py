@@ -0,0 +1,38 @@
+import logging
+import azure.functions as func
+
+from shared_code.serialization import rows_to_ndjson, NDJSON_MIMETYPE
+
+DEFAULT_PAGE_SIZE = 1000
+MAX_PAGE_SIZE = 5000
+
+# Exports [dbo].[user_preferences] one keyset page at a time, as NDJSON (one row per line).
+# The query returns up to `limit` rows (default 1000, at most 5000) with an id greater than
+# `after`, optionally filtered by `userid` and `marked_as_preference`, so each invocation
+# only holds one page in memory however large the table grows.
+# Every query parameter must be present, as the SQL binding cannot bind missing ones; pass
+# an empty value to leave a filter off, e.g.
+# `preferences/export?after=0&limit=1000&userid=&marked_as_preference=1`.
+# When there may be more rows the `X-Next-After` header holds the `after` for the next page.
+# Preferences refer to their recipe by `recipe_hash`; the recipe text is joined back in from
+# [dbo].[recipes], falling back to the row's own `recipe` for rows stored before the hash.
+def main(req: func.HttpRequest, preferences: func.SqlRowList) -> func.HttpResponse:
+
+    logging.info("Exporting a page of user preferences")
+    try:
+        limit = int(req.params.get("limit", ""))
+    except ValueError:
+        limit = DEFAULT_PAGE_SIZE
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        limit = DEFAULT_PAGE_SIZE
+
+    headers = {}
+    if len(preferences) == limit:
+        headers["X-Next-After"] = str(preferences[-1]["id"])
+
+    return func.HttpResponse(
+        rows_to_ndjson(preferences),
+        status_code=200,
+        mimetype=NDJSON_MIMETYPE,
+        headers=headers
+    )
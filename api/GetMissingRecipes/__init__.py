@@ -0,0 +1,17 @@
+import logging
+import json
+import azure.functions as func
+
+# Recipes are stored once in [dbo].[recipes], keyed by the sha256 of their text. The
+# `hashes` query parameter is a JSON array of hashes, e.g. `recipes/missing?hashes=["ab12..."]`,
+# and the response lists the ones the table doesn't hold yet, so clients only upload those.
+def main(req: func.HttpRequest, missing: func.SqlRowList) -> func.HttpResponse:
+
+    logging.info("Converting the payload to json")
+    body = [row["hash"] for row in missing]
+
+    return func.HttpResponse(
+        json.dumps(body),
+        status_code=200,
+        mimetype="application/json"
+    )
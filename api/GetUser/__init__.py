@@ -1,7 +1,8 @@
 import logging
-import json
 import azure.functions as func
 
+from shared_code.serialization import rows_response
+
 # The input binding executes the `SELECT * FROM users WHERE id = @id` query.
 # The Parameters argument passes the `{id}` specified in the URL that triggers the function,
 # `users/{id}`, as the value of the `@id` parameter in the query.
@@ -9,10 +10,4 @@ import azure.functions as func
 def main(req: func.HttpRequest, users: func.SqlRowList) -> func.HttpResponse:
     
     logging.info("Converting the payload to json")
-    rows = list(map(lambda r: json.loads(r.to_json()), users))
-
-    return func.HttpResponse(
-        json.dumps(rows),
-        status_code=200,
-        mimetype="application/json"
-    )
\ No newline at end of file
+    return rows_response(req, users)
@@ -0,0 +1,35 @@
+import logging
+import json
+import hashlib
+import azure.functions as func
+
+# The input binding joins the user's row with their allergies, so one query returns
+# one row per allergy (or a single row with a NULL allergy_ingredient when there are none).
+# The response carries an ETag; callers sending a matching If-None-Match get a 304.
+def main(req: func.HttpRequest, profile: func.SqlRowList) -> func.HttpResponse:
+
+    logging.info("Converting the payload to json")
+    rows = [row.data for row in profile]
+
+    user = None
+    allergies = []
+    if rows:
+        user = {k: v for k, v in rows[0].items() if k != "allergy_ingredient"}
+        allergies = [
+            row["allergy_ingredient"] for row in rows
+                if row.get("allergy_ingredient") is not None
+        ]
+
+    body = json.dumps({"user": user, "allergies": allergies})
+    etag = '"' + hashlib.sha256(body.encode("utf-8")).hexdigest()[:32] + '"'
+
+    if_none_match = req.headers.get("If-None-Match", "")
+    if etag in [tag.strip() for tag in if_none_match.split(",")]:
+        return func.HttpResponse(status_code=304, headers={"ETag": etag})
+
+    return func.HttpResponse(
+        body,
+        status_code=200,
+        mimetype="application/json",
+        headers={"ETag": etag}
+    )
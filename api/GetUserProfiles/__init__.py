@@ -0,0 +1,31 @@
+import logging
+import json
+import azure.functions as func
+
+# Batch version of GetUserProfile. The `ids` query parameter is a JSON array of user ids,
+# e.g. `profiles?ids=["id1","id2"]`, which the query expands with OPENJSON so every
+# requested user and their allergies come back from a single query.
+# Ids that don't match a user are simply absent from the response.
+def main(req: func.HttpRequest, profiles: func.SqlRowList) -> func.HttpResponse:
+
+    logging.info("Converting the payload to json")
+    rows = [row.data for row in profiles]
+
+    users = {}
+    allergies = {}
+    for row in rows:
+        user = {k: v for k, v in row.items() if k != "allergy_ingredient"}
+        users.setdefault(user["id"], user)
+        user_allergies = allergies.setdefault(user["id"], [])
+        if row.get("allergy_ingredient") is not None:
+            user_allergies.append(row["allergy_ingredient"])
+
+    body = [
+        {"user": user, "allergies": allergies[id]}
+            for id, user in users.items()
+    ]
+    return func.HttpResponse(
+        json.dumps(body),
+        status_code=200,
+        mimetype="application/json"
+    )
@@ -0,0 +1,36 @@
+import json
+import azure.functions as func
+
+NDJSON_MIMETYPE = "application/x-ndjson"
+
+# SqlRow is a UserDict, so its underlying dict (`.data`) can be handed to json
+# directly instead of round-tripping every row through to_json() and json.loads().
+def rows_to_json(rows: func.SqlRowList) -> str:
+    return json.dumps([row.data for row in rows])
+
+def rows_to_ndjson(rows: func.SqlRowList) -> str:
+    encode = json.JSONEncoder().encode
+    return "".join(encode(row.data) + "\n" for row in rows)
+
+def wants_ndjson(req: func.HttpRequest) -> bool:
+    return (
+        req.params.get("format") == "ndjson"
+        or NDJSON_MIMETYPE in req.headers.get("Accept", "")
+    )
+
+def rows_response(req: func.HttpRequest, rows: func.SqlRowList) -> func.HttpResponse:
+    """
+    Writes the rows as one JSON array, or as newline-delimited JSON (one row per line)
+    when the caller asks for `?format=ndjson` or `Accept: application/x-ndjson`.
+    """
+    if wants_ndjson(req):
+        return func.HttpResponse(
+            rows_to_ndjson(rows),
+            status_code=200,
+            mimetype=NDJSON_MIMETYPE
+        )
+    return func.HttpResponse(
+        rows_to_json(rows),
+        status_code=200,
+        mimetype="application/json"
+    )
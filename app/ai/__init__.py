@@ -1,4 +1,33 @@
-from .cognitive_services import TextAnalytics, ImageAnalytics
-from .recipe_generation import RecipeGenerator
+import importlib
 
-__all__ = ["TextAnalytics", "ImageAnalytics", "RecipeGenerator"]
\ No newline at end of file
+# Names are imported from their submodule on first use, so importing a light module
+# such as ai.batch_scheduler doesn't pull in transformers, PIL or the Azure SDKs, or
+# build the TEXT_ANALYTICS / IMAGE_ANALYTICS clients
+_EXPORTS = {
+    "TextAnalytics": "cognitive_services",
+    "ImageAnalytics": "cognitive_services",
+    "TEXT_ANALYTICS": "cognitive_services",
+    "IMAGE_ANALYTICS": "cognitive_services",
+    "RecipeGenerator": "recipe_generation",
+    "enable_compilation_cache": "recipe_generation",
+    "BatchScheduler": "batch_scheduler",
+    "InferenceExecutor": "inference_executor",
+    "InferenceQueueFullError": "inference_executor",
+    "RecipeCache": "recipe_cache",
+    "MemoryCacheBackend": "recipe_cache",
+    "DiskCacheBackend": "recipe_cache",
+    "PerceptualHashCache": "image_cache",
+    "LocalIngredientDetector": "local_detection",
+    "IngredientLexicon": "ingredient_lexicon",
+    "INGREDIENT_LEXICON": "ingredient_lexicon",
+    "ModelRegistry": "model_registry"
+}
+
+__all__ = list(_EXPORTS)
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module("." + _EXPORTS[name], __name__), name)
+    globals()[name] = value
+    return value
@@ -0,0 +1,110 @@
+import asyncio
+
+from typing import Callable, List
+
+from .inference_executor import InferenceExecutor
+
+class BatchScheduler:
+    """
+    Collects generation requests from concurrent conversations for a short window
+    and runs them as a single batched call on the inference executor, handing each
+    caller back only its own outputs. Without an executor the batch function is a
+    coroutine function and is awaited on the event loop, e.g. for remote services
+    that accept several documents per request.
+
+    Keyword options given to submit apply to every input of that request; the batch
+    function receives each option as a list with one value per input.
+    """
+
+    def __init__(
+        self,
+        batch_function: Callable[..., List[str]],
+        executor: InferenceExecutor = None,
+        max_batch_size: int = 8,
+        batch_window_ms: float = 20
+    ):
+        self._batch_function = batch_function
+        self._executor = executor
+        self.max_batch_size = max_batch_size
+        self.batch_window_seconds = batch_window_ms / 1000
+
+        self._pending = []
+        self._pending_size = 0
+        self._flush_handle = None
+
+        self.requests = 0
+        self.batches = 0
+        self.batched_inputs = 0
+        self.largest_batch = 0
+
+    async def submit(self, texts, **options) -> List[str]:
+        inputs = texts if isinstance(texts, list) else [texts]
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.requests += 1
+
+        # Don't let a new request push the open batch over the size limit
+        if self._pending and self._pending_size + len(inputs) > self.max_batch_size:
+            self._flush()
+
+        self._pending.append((inputs, options, future))
+        self._pending_size += len(inputs)
+
+        if self._pending_size >= self.max_batch_size or self.batch_window_seconds <= 0:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.batch_window_seconds, self._flush)
+
+        return await future
+
+    def _flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if not self._pending:
+            return
+
+        batch = self._pending
+        self._pending = []
+        self._pending_size = 0
+        asyncio.ensure_future(self._run_batch(batch))
+
+    async def _run_batch(self, batch):
+        flat_inputs = [text for inputs, _, _ in batch for text in inputs]
+        option_names = {name for _, options, _ in batch for name in options}
+        flat_options = {
+            name: [options.get(name) for inputs, options, _ in batch for _ in inputs]
+            for name in option_names
+        }
+        self.batches += 1
+        self.batched_inputs += len(flat_inputs)
+        self.largest_batch = max(self.largest_batch, len(flat_inputs))
+
+        try:
+            if self._executor is None:
+                outputs = await self._batch_function(flat_inputs, **flat_options)
+            else:
+                outputs = await self._executor.run(
+                    self._batch_function, flat_inputs, **flat_options
+                )
+        except Exception as err:
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(err)
+            return
+
+        offset = 0
+        for inputs, _, future in batch:
+            if not future.done():
+                future.set_result(outputs[offset:offset + len(inputs)])
+            offset += len(inputs)
+
+    def stats(self) -> dict:
+        return {
+            "max_batch_size": self.max_batch_size,
+            "batch_window_ms": self.batch_window_seconds * 1000,
+            "requests": self.requests,
+            "batches": self.batches,
+            "avg_batch_size": self.batched_inputs / self.batches if self.batches else None,
+            "largest_batch": self.largest_batch,
+        }
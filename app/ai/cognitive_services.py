@@ -1,21 +1,59 @@
+import asyncio
+import io
 import os
-import urllib.request
-import tempfile
-import shutil
+import sys
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from config import DefaultConfig
 
-from azure.ai.textanalytics import TextAnalyticsClient
+import aiohttp
+
+from .batch_scheduler import BatchScheduler
+from .image_cache import PerceptualHashCache, perceptual_hash
+from .inference_executor import InferenceExecutor
+from .local_detection import LocalIngredientDetector
+
+from azure.ai.textanalytics.aio import TextAnalyticsClient
 from azure.core.credentials import AzureKeyCredential
 
 from azure.cognitiveservices.vision.customvision.prediction import CustomVisionPredictionClient
 from msrest.authentication import ApiKeyCredentials
 
+from PIL import Image, ImageOps
+
 
-from typing import List
+from typing import List, Optional, Tuple
 
 class TextAnalytics:
-    def __init__(self):
-        self.client = self._authenticate_client()
+    """
+    Key phrase extraction through one shared async Text Analytics client. Results are
+    cached by normalized text, evicting the least recently used, so common inputs
+    like "eggs and milk" are only sent to the service once. Cache misses from
+    concurrent conversations are gathered for batch_window_ms and sent together as
+    one multi-document request.
+    """
+
+    def __init__(
+        self,
+        cache_max_entries: int = 10000,
+        max_batch_size: int = 10,
+        batch_window_ms: float = 10
+    ):
+        self.cache_max_entries = cache_max_entries
+        self._cache = OrderedDict()
+        # Created lazily, as the async client belongs to the running event loop
+        self.client = None
+        self.batch_scheduler = BatchScheduler(
+            self._extract_key_phrases_batch,
+            max_batch_size=max_batch_size,
+            batch_window_ms=batch_window_ms
+        )
+
+        self.hits = 0
+        self.misses = 0
+        self.service_calls = 0
+        self.errors = 0
 
     def _authenticate_client(self):
         ta_credential = AzureKeyCredential(DefaultConfig.COGNITIVE_SERVICES_KEY)
@@ -24,51 +62,325 @@ class TextAnalytics:
             credential=ta_credential
         )
         return text_analytics_client
-    
-    def key_phrase_extraction(self, documents: List[str]):
-        
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        return " ".join(text.lower().split())
+
+    async def key_phrase_extraction(self, text: str) -> Optional[List[str]]:
+        # The normalized text is what gets sent, so every input sharing a cache
+        # entry would have received the same key phrases
+        document = self.normalize(text)
+        key_phrases = self._cache.get(document)
+        if key_phrases is not None:
+            self._cache.move_to_end(document)
+            self.hits += 1
+            return list(key_phrases)
+        self.misses += 1
+
+        key_phrases = (await self.batch_scheduler.submit(document))[0]
+        if key_phrases is None:
+            return None
+
+        self._cache[document] = key_phrases
+        while len(self._cache) > self.cache_max_entries:
+            self._cache.popitem(last=False)
+        return list(key_phrases)
+
+    async def _extract_key_phrases_batch(self, documents: List[str]) -> List[Optional[List[str]]]:
+        """
+        Sends every distinct document in one request. Documents the service could
+        not process come back as None without failing the rest of the batch.
+        """
+        distinct = list(dict.fromkeys(documents))
+        if self.client is None:
+            self.client = self._authenticate_client()
         try:
-            response = self.client.extract_key_phrases(documents=documents)[0]
+            self.service_calls += 1
+            responses = await self.client.extract_key_phrases(documents=distinct)
+
+        except Exception as err:
+            self.errors += len(distinct)
+            print("Encountered exception. {}".format(err))
+            return [None] * len(documents)
+
+        key_phrases = {}
+        for document, response in zip(distinct, responses):
             if response.is_error:
+                self.errors += 1
                 print(response.id, response.error)
-                return None
+                key_phrases[document] = None
             else:
-                return response.key_phrases
+                key_phrases[document] = response.key_phrases
+        return [key_phrases[document] for document in documents]
 
-        except Exception as err:
-            print("Encountered exception. {}".format(err))
+    async def close(self):
+        if self.client is not None:
+            await self.client.close()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._cache),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else None,
+            "service_calls": self.service_calls,
+            "errors": self.errors,
+            "batching": self.batch_scheduler.stats(),
+        }
 
 class ImageAnalytics:
-    def __init__(self):
-        self.client = self._authenticate_client()
+    """
+    Ingredient detection with the Custom Vision model. The attachments of a message are
+    downloaded concurrently over one pooled session and handed to the prediction client
+    straight from memory; predictions run on a small thread pool, as that client is
+    synchronous. Images larger than max_image_bytes are skipped.
+
+    Before upload each photo is downscaled so its longest side is at most max_dimension
+    and re-encoded as a JPEG, on the same thread pool, since uploading full size phone
+    photos is most of an image turn's latency. With a detection_cache, photos that look
+    like a recently analysed one reuse its detections instead of being uploaded.
+
+    Given a local_detector, photos are analysed by an exported copy of the model
+    in-process instead of by the Custom Vision service.
+    """
+
+    def __init__(
+        self,
+        max_image_bytes: int = 20 * 1024 * 1024,
+        max_connections: int = 10,
+        max_workers: int = 4,
+        timeout_seconds: float = 30,
+        probability_threshold: float = 0.5,
+        max_dimension: int = 512,
+        jpeg_quality: int = 85,
+        detection_cache: PerceptualHashCache = None,
+        local_detector: LocalIngredientDetector = None
+    ):
+        self.local_detector = local_detector
+        self.client = self._authenticate_client() if local_detector is None else None
         self.project_id = "891232d0-5cda-4a76-adcb-ce15dd53b584"
         self.publish_iteration_name = "IngredientDetectorModel"
+        self.max_image_bytes = max_image_bytes
+        self.max_connections = max_connections
+        self.timeout = aiohttp.ClientTimeout(total=timeout_seconds)
+        self.probability_threshold = probability_threshold
+        self.max_dimension = max_dimension
+        self.jpeg_quality = jpeg_quality
+        self.detection_cache = detection_cache
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="image-analytics"
+        )
+        # Created lazily, as it needs to belong to the running event loop
+        self._session = None
+
+        self.images = 0
+        self.oversized = 0
+        self.errors = 0
+        self.bytes_received = 0
+        self.bytes_uploaded = 0
+        self.prepare_seconds = 0.0
+        self.requests = 0
+        self.total_seconds = 0.0
 
     def _authenticate_client(self):
         prediction_credentials = ApiKeyCredentials(in_headers={"Prediction-key": DefaultConfig.COGNITIVE_SERVICES_KEY})
         predictor = CustomVisionPredictionClient(DefaultConfig.COGNITIVE_SERVICES_ENDPOINT, prediction_credentials)
         return predictor
-    
-    def detect_objects_in_attachments(self, attachments):
-        # Send the image data to the Computer Vision Service
-        detected_objects = []
-        for attachment in attachments:
-            with urllib.request.urlopen(attachment.content_url) as response:
-
-                data = response.read()
-                with tempfile.NamedTemporaryFile(delete=False, suffix=attachment.name) as tmp_file:
-                    tmp_file.write(data)
-                with open(tmp_file.name, "rb") as f:
-                    detect_objects_results = self.client.detect_image(
-                        self.project_id, self.publish_iteration_name, f)
-
-            # Unpack the response from the computer vision service in an easy to work with format
-            
-            for result in detect_objects_results.predictions:
-                object_name = result.tag_name
-                detection_confidence = result.probability
-                if detection_confidence > 0.5:
-                    detected_objects.append(object_name)
-            # Remove duplicates
-            detected_objects = list(set(detected_objects))
-        return detected_objects
\ No newline at end of file
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.max_connections)
+            self._session = aiohttp.ClientSession(connector=connector, timeout=self.timeout)
+        return self._session
+
+    async def _fetch(self, url: str) -> Optional[bytes]:
+        """
+        Returns the image bytes, or None when the image is over max_image_bytes.
+        """
+        async with self._get_session().get(url) as response:
+            response.raise_for_status()
+            if response.content_length is not None and response.content_length > self.max_image_bytes:
+                self.oversized += 1
+                return None
+            # Content-Length is optional, so the cap is checked as the body arrives too
+            data = bytearray()
+            async for chunk in response.content.iter_chunked(64 * 1024):
+                data.extend(chunk)
+                if len(data) > self.max_image_bytes:
+                    self.oversized += 1
+                    return None
+            return bytes(data)
+
+    def _prepare(self, data: bytes) -> Tuple[bytes, int]:
+        """
+        Returns the image downscaled and re-encoded as a JPEG, or the original bytes
+        when they are already a small enough JPEG or re-encoding wouldn't shrink them,
+        along with the image's perceptual hash.
+        """
+        image = Image.open(io.BytesIO(data))
+        if image.format == "JPEG" and max(image.size) <= self.max_dimension:
+            return data, perceptual_hash(ImageOps.exif_transpose(image))
+        # Let the JPEG decoder scale down while decoding, which is far cheaper than
+        # decoding the full image and resizing it afterwards
+        image.draft("RGB", (self.max_dimension, self.max_dimension))
+        # Phones record the orientation in EXIF, which is lost on re-encoding
+        image = ImageOps.exif_transpose(image).convert("RGB")
+        image.thumbnail((self.max_dimension, self.max_dimension), Image.LANCZOS)
+
+        output = io.BytesIO()
+        image.save(output, format="JPEG", quality=self.jpeg_quality)
+        prepared = output.getvalue()
+        return (prepared if len(prepared) < len(data) else data), perceptual_hash(image)
+
+    def _detect(self, data: bytes) -> List[str]:
+        detect_objects_results = self.client.detect_image(
+            self.project_id, self.publish_iteration_name, io.BytesIO(data))
+        # Unpack the response from the computer vision service in an easy to work with format
+        return [
+            result.tag_name for result in detect_objects_results.predictions
+                if result.probability > self.probability_threshold
+        ]
+
+    async def _predict(self, data: bytes) -> List[str]:
+        if self.local_detector is not None:
+            predictions = await self.local_detector.detect(data)
+            return [
+                tag_name for tag_name, probability in predictions
+                    if probability > self.probability_threshold
+            ]
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self._detect, data)
+
+    async def _detect_one(self, attachment=None, data: bytes = None) -> Optional[List[str]]:
+        """
+        Analyses one attachment, or image bytes already in memory. Returns None when
+        the image is too large or could not be analysed.
+        """
+        self.images += 1
+        try:
+            if data is None:
+                data = await self._fetch(attachment.content_url)
+                if data is None:
+                    return None
+            loop = asyncio.get_running_loop()
+            start = time.perf_counter()
+            prepared, image_hash = await loop.run_in_executor(self._executor, self._prepare, data)
+            self.prepare_seconds += time.perf_counter() - start
+            self.bytes_received += len(data)
+
+            if self.detection_cache is not None:
+                detected_objects = self.detection_cache.get(image_hash)
+                if detected_objects is not None:
+                    return detected_objects
+            if self.local_detector is None:
+                self.bytes_uploaded += len(prepared)
+            detected_objects = await self._predict(prepared)
+            if self.detection_cache is not None:
+                self.detection_cache.set(image_hash, detected_objects)
+            return detected_objects
+
+        except Exception as err:
+            self.errors += 1
+            print("Encountered exception. {}".format(err))
+            return None
+
+    @staticmethod
+    def _merge(results) -> Optional[List[str]]:
+        if all(result is None for result in results):
+            return None
+        # Remove duplicates
+        return list(dict.fromkeys(
+            object_name for result in results if result for object_name in result
+        ))
+
+    async def detect_objects_in_attachments(self, attachments) -> Optional[List[str]]:
+        """
+        Returns the ingredients detected across all attachments, or None when none of
+        them could be analysed.
+        """
+        start = time.perf_counter()
+        results = await asyncio.gather(
+            *[self._detect_one(attachment) for attachment in attachments]
+        )
+        self.requests += 1
+        self.total_seconds += time.perf_counter() - start
+        return self._merge(results)
+
+    async def detect_objects_in_images(self, images: List[bytes]) -> Optional[List[str]]:
+        """
+        Same as detect_objects_in_attachments, for images that are already in memory.
+        """
+        start = time.perf_counter()
+        results = await asyncio.gather(*[self._detect_one(data=data) for data in images])
+        self.requests += 1
+        self.total_seconds += time.perf_counter() - start
+        return self._merge(results)
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._executor.shutdown(wait=False)
+        if self.local_detector is not None:
+            self.local_detector.executor.shutdown()
+
+    def stats(self) -> dict:
+        return {
+            "images": self.images,
+            "oversized": self.oversized,
+            "errors": self.errors,
+            "bytes_received": self.bytes_received,
+            "bytes_uploaded": self.bytes_uploaded,
+            "bytes_saved": self.bytes_received - self.bytes_uploaded,
+            "avg_prepare_ms": self.prepare_seconds / self.images * 1000 if self.images else None,
+            "avg_latency_ms": self.total_seconds / self.requests * 1000 if self.requests else None,
+            "detection_cache": self.detection_cache.stats() if self.detection_cache is not None else None,
+            "local_detector": self.local_detector.stats() if self.local_detector is not None else None,
+        }
+
+# One client, cache and batcher shared by every conversation
+TEXT_ANALYTICS = TextAnalytics(
+    cache_max_entries=DefaultConfig.KEY_PHRASE_CACHE_MAX_ENTRIES,
+    max_batch_size=DefaultConfig.KEY_PHRASE_MAX_BATCH_SIZE,
+    batch_window_ms=DefaultConfig.KEY_PHRASE_BATCH_WINDOW_MS
+)
+
+def _load_local_detector() -> Optional[LocalIngredientDetector]:
+    # A missing or incompatible model mustn't stop the bot from starting; photos are
+    # then sent to the Custom Vision prediction API instead
+    if DefaultConfig.IMAGE_ANALYTICS_BACKEND != "local":
+        return None
+    try:
+        return LocalIngredientDetector(
+            DefaultConfig.LOCAL_IMAGE_MODEL_PATH,
+            DefaultConfig.LOCAL_IMAGE_LABELS_PATH,
+            executor=InferenceExecutor(1, DefaultConfig.LOCAL_IMAGE_QUEUE_DEPTH),
+            max_batch_size=DefaultConfig.LOCAL_IMAGE_MAX_BATCH_SIZE,
+            batch_window_ms=DefaultConfig.LOCAL_IMAGE_BATCH_WINDOW_MS,
+            num_threads=DefaultConfig.LOCAL_IMAGE_THREADS,
+            classes_output=DefaultConfig.LOCAL_IMAGE_CLASSES_OUTPUT,
+            scores_output=DefaultConfig.LOCAL_IMAGE_SCORES_OUTPUT
+        )
+    except Exception as err:
+        print(
+            f"Could not load the local ingredient detector from {DefaultConfig.LOCAL_IMAGE_MODEL_PATH}, "
+            f"falling back to the Custom Vision prediction API: {err}",
+            file=sys.stderr
+        )
+        return None
+
+IMAGE_ANALYTICS = ImageAnalytics(
+    max_image_bytes=DefaultConfig.IMAGE_MAX_BYTES,
+    max_connections=DefaultConfig.IMAGE_FETCH_MAX_CONNECTIONS,
+    max_workers=DefaultConfig.IMAGE_ANALYSIS_WORKERS,
+    timeout_seconds=DefaultConfig.IMAGE_FETCH_TIMEOUT_SECONDS,
+    max_dimension=DefaultConfig.IMAGE_MAX_DIMENSION,
+    jpeg_quality=DefaultConfig.IMAGE_JPEG_QUALITY,
+    detection_cache=PerceptualHashCache(
+        ttl_seconds=DefaultConfig.IMAGE_CACHE_TTL_SECONDS,
+        max_distance=DefaultConfig.IMAGE_CACHE_MAX_DISTANCE,
+        max_entries=DefaultConfig.IMAGE_CACHE_MAX_ENTRIES
+    ) if DefaultConfig.IMAGE_CACHE_MAX_ENTRIES > 0 else None,
+    local_detector=_load_local_detector()
+)
@@ -0,0 +1,81 @@
+import time
+from collections import OrderedDict
+
+from typing import List, Optional
+
+from PIL import Image
+
+def perceptual_hash(image: Image.Image, hash_size: int = 8) -> int:
+    """
+    Difference hash: one bit per neighbouring pixel pair of a tiny grayscale copy,
+    set when brightness increases left to right. Re-encoding, rescaling and small
+    exposure changes flip only a few bits, so near-duplicate photos have hashes a
+    small Hamming distance apart.
+    """
+    pixels = list(
+        image.convert("L").resize((hash_size + 1, hash_size), Image.BILINEAR).getdata()
+    )
+    image_hash = 0
+    for row in range(hash_size):
+        for col in range(hash_size):
+            left = pixels[row * (hash_size + 1) + col]
+            right = pixels[row * (hash_size + 1) + col + 1]
+            image_hash = (image_hash << 1) | (right > left)
+    return image_hash
+
+class PerceptualHashCache:
+    """
+    Remembers the ingredients detected in recent photos, keyed by perceptual hash.
+    A lookup hits when a cached photo is within max_distance differing bits, so a
+    resent or slightly different photo of the same fridge skips the prediction.
+    """
+
+    def __init__(
+        self,
+        ttl_seconds: float = 3600,
+        max_distance: int = 6,
+        max_entries: int = 1000
+    ):
+        self.ttl_seconds = ttl_seconds
+        self.max_distance = max_distance
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, image_hash: int) -> Optional[List[str]]:
+        now = time.monotonic()
+        match = None
+        best_distance = self.max_distance + 1
+        for cached_hash, (expires_at, detected_objects) in list(self._entries.items()):
+            if now >= expires_at:
+                del self._entries[cached_hash]
+                continue
+            distance = bin(cached_hash ^ image_hash).count("1")
+            if distance < best_distance:
+                match, best_distance = cached_hash, distance
+
+        if match is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries.move_to_end(match)
+        return list(self._entries[match][1])
+
+    def set(self, image_hash: int, detected_objects: List[str]):
+        self._entries[image_hash] = (time.monotonic() + self.ttl_seconds, list(detected_objects))
+        self._entries.move_to_end(image_hash)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else None,
+            # Every hit is a prediction call that wasn't made
+            "saved_predictions": self.hits,
+        }
@@ -0,0 +1,95 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+class InferenceQueueFullError(Exception):
+    pass
+
+class InferenceExecutor:
+    """
+    Runs blocking model inference on a bounded pool of worker threads so the
+    aiohttp event loop keeps serving other conversations while a model runs.
+    """
+
+    def __init__(self, max_workers: int = 1, max_queue_depth: int = 16):
+        self.max_workers = max_workers
+        self.max_queue_depth = max_queue_depth
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="inference"
+        )
+        # Only touched from the event loop thread
+        self._pending = 0
+
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.total_queue_wait_seconds = 0.0
+        self.max_queue_wait_seconds = 0.0
+        self.total_run_seconds = 0.0
+        self.max_run_seconds = 0.0
+
+    @property
+    def queue_depth(self) -> int:
+        return max(0, self._pending - self.max_workers)
+
+    async def run(self, func, *args, **kwargs):
+        if self.queue_depth >= self.max_queue_depth:
+            self.rejected += 1
+            raise InferenceQueueFullError(
+                f"Inference queue is full ({self.max_queue_depth} requests waiting)"
+            )
+
+        self._pending += 1
+        self.submitted += 1
+        enqueued_at = time.perf_counter()
+        timings = {}
+
+        def timed_call():
+            started_at = time.perf_counter()
+            timings["queue_wait"] = started_at - enqueued_at
+            try:
+                return func(*args, **kwargs)
+            finally:
+                timings["run"] = time.perf_counter() - started_at
+
+        loop = asyncio.get_running_loop()
+        try:
+            result = await loop.run_in_executor(self._executor, timed_call)
+        except Exception:
+            self.failed += 1
+            raise
+        else:
+            self.completed += 1
+            return result
+        finally:
+            self._pending -= 1
+            self._record(timings)
+
+    def _record(self, timings: dict):
+        queue_wait = timings.get("queue_wait", 0.0)
+        run = timings.get("run", 0.0)
+        self.total_queue_wait_seconds += queue_wait
+        self.max_queue_wait_seconds = max(self.max_queue_wait_seconds, queue_wait)
+        self.total_run_seconds += run
+        self.max_run_seconds = max(self.max_run_seconds, run)
+
+    def shutdown(self, wait: bool = True):
+        self._executor.shutdown(wait=wait)
+
+    def stats(self) -> dict:
+        finished = self.completed + self.failed
+        return {
+            "max_workers": self.max_workers,
+            "max_queue_depth": self.max_queue_depth,
+            "queue_depth": self.queue_depth,
+            "in_flight": self._pending,
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "avg_queue_wait_seconds": self.total_queue_wait_seconds / finished if finished else None,
+            "max_queue_wait_seconds": self.max_queue_wait_seconds,
+            "avg_run_seconds": self.total_run_seconds / finished if finished else None,
+            "max_run_seconds": self.max_run_seconds,
+        }
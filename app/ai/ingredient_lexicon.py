@@ -0,0 +1,157 @@
+import re
+
+from typing import Iterable, List, Optional, Tuple
+
+from config import DefaultConfig
+
+TOKEN_PATTERN = re.compile(r"[a-z]+(?:'[a-z]+)?|\d+(?:[./]\d+)?|[¼-¾⅐-⅞]|[,;&+/\n]")
+
+# Words that join or quantify ingredients rather than name them
+SEPARATORS = {",", ";", "&", "+", "/", "\n", "and", "or", "with", "plus", "also"}
+QUANTITIES = {
+    "a", "an", "some", "few", "couple", "several", "half", "dozen", "bit", "lot", "lots",
+    "of", "the", "my", "i", "have", "got", "there", "is", "are",
+}
+# Units and modifiers only quantify the word after them ("2 cloves of garlic", "frozen
+# peas"). On their own, as in "cinnamon and cloves", they may well be the ingredient,
+# so they are looked up like any other word.
+UNITS = {
+    "g", "gram", "kg", "kilo", "mg", "ml", "l", "litre", "liter", "oz", "ounce", "lb",
+    "pound", "cup", "tbsp", "tablespoon", "tsp", "teaspoon", "pinch", "handful", "bunch",
+    "can", "tin", "jar", "pack", "packet", "bag", "bottle", "box", "carton", "slice",
+    "piece", "clove", "head", "stick", "fresh", "frozen", "leftover", "chopped", "large",
+    "small", "medium",
+}
+
+IRREGULAR_SINGULARS = {"leaves": "leaf", "loaves": "loaf", "halves": "half", "knives": "knife"}
+
+def singular(word: str) -> str:
+    """
+    Folds common English plurals. The same folding is applied to the vocabulary and
+    to the input, so a word it gets wrong still matches itself.
+    """
+    if word in IRREGULAR_SINGULARS:
+        return IRREGULAR_SINGULARS[word]
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 4 and word.endswith("oes"):
+        return word[:-2]
+    if word.endswith(("ches", "shes", "xes")):
+        return word[:-2]
+    if len(word) > 3 and word.endswith("s") and not word.endswith(("ss", "us")):
+        return word[:-1]
+    return word
+
+def is_number(token: str) -> bool:
+    return token[0].isdigit() or not token.isascii()
+
+def is_quantity(token: str, next_token: Optional[str] = None) -> bool:
+    """
+    Whether token only quantifies an ingredient. next_token is the token after it,
+    if any, which a unit needs to be followed by.
+    """
+    if token in QUANTITIES or singular(token) in QUANTITIES or is_number(token):
+        return True
+    return (
+        (token in UNITS or singular(token) in UNITS)
+        and next_token is not None
+        and next_token not in SEPARATORS
+        and not is_number(next_token)
+    )
+
+class IngredientLexicon:
+    """
+    Picks ingredients out of plain lists like "eggs, milk and 2 tomatoes" with a
+    word-level trie of known ingredients, matching the longest known phrase at each
+    word. Separators and quantities are skipped, as are units in front of another
+    word; every other word counts towards coverage, the share of words that were
+    recognised as an ingredient.
+    """
+
+    _END = object()
+
+    def __init__(self, ingredients: Iterable[str], min_coverage: float = 1.0):
+        self.min_coverage = min_coverage
+        self._trie = {}
+        for ingredient in ingredients:
+            node = self._trie
+            for word in ingredient.lower().split():
+                node = node.setdefault(singular(word), {})
+            node[self._END] = True
+
+        self.lookups = 0
+        self.local_hits = 0
+
+    @classmethod
+    def from_file(cls, path: str, min_coverage: float = 1.0) -> "IngredientLexicon":
+        with open(path) as f:
+            ingredients = [
+                line.strip() for line in f
+                    if line.strip() and not line.startswith("#")
+            ]
+        return cls(ingredients, min_coverage)
+
+    def extract_with_coverage(self, text: str) -> Tuple[List[str], float]:
+        """
+        Returns the ingredients found, as written in the text, and the coverage.
+        """
+        tokens = TOKEN_PATTERN.findall(text.lower())
+        words = [singular(token) for token in tokens]
+
+        ingredients = []
+        content_words = 0
+        matched_words = 0
+        position = 0
+        while position < len(tokens):
+            token = tokens[position]
+            next_token = tokens[position + 1] if position + 1 < len(tokens) else None
+            if token in SEPARATORS or is_quantity(token, next_token):
+                position += 1
+                continue
+
+            node = self._trie
+            match_end = None
+            for end in range(position, len(tokens)):
+                node = node.get(words[end])
+                if node is None:
+                    break
+                if self._END in node:
+                    match_end = end + 1
+
+            if match_end is None:
+                content_words += 1
+                position += 1
+            else:
+                content_words += match_end - position
+                matched_words += match_end - position
+                ingredients.append(" ".join(tokens[position:match_end]))
+                position = match_end
+
+        coverage = matched_words / content_words if content_words else 0.0
+        return list(dict.fromkeys(ingredients)), coverage
+
+    def extract(self, text: str) -> Optional[List[str]]:
+        """
+        Returns the ingredients, or None when too little of the text was recognised
+        to trust the result and key phrase extraction should be used instead.
+        """
+        self.lookups += 1
+        ingredients, coverage = self.extract_with_coverage(text)
+        if not ingredients or coverage < self.min_coverage:
+            return None
+        self.local_hits += 1
+        return ingredients
+
+    def stats(self) -> dict:
+        return {
+            "lookups": self.lookups,
+            "local_hits": self.local_hits,
+            "fallbacks": self.lookups - self.local_hits,
+            "hit_rate": self.local_hits / self.lookups if self.lookups else None,
+        }
+
+# Shared by every conversation
+INGREDIENT_LEXICON = IngredientLexicon.from_file(
+    DefaultConfig.INGREDIENT_VOCABULARY_PATH,
+    min_coverage=DefaultConfig.INGREDIENT_LEXICON_MIN_COVERAGE
+)
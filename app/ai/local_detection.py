@@ -0,0 +1,123 @@
+import io
+
+import numpy as np
+from PIL import Image
+
+from typing import List, Tuple
+
+from .batch_scheduler import BatchScheduler
+from .inference_executor import InferenceExecutor
+
+class LocalIngredientDetector:
+    """
+    Runs an ONNX export of the Custom Vision ingredient detector in-process on CPU.
+    Only compact domains can be exported, so the project in
+    custom_models/IngredientDetection.ipynb has to be trained on "General (compact)"
+    for this; the export's model.onnx and labels.txt are what this loads.
+
+    The session is loaded once and shared. Photos from every conversation are
+    gathered for batch_window_ms and run as one batch on the executor.
+    """
+
+    def __init__(
+        self,
+        model_path: str,
+        labels_path: str,
+        executor: InferenceExecutor,
+        max_batch_size: int = 8,
+        batch_window_ms: float = 5,
+        num_threads: int = 0,
+        classes_output: str = "detected_classes",
+        scores_output: str = "detected_scores"
+    ):
+        # Only needed when the local backend is selected
+        import onnxruntime
+
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = num_threads
+        self.session = onnxruntime.InferenceSession(
+            model_path, sess_options=options, providers=["CPUExecutionProvider"]
+        )
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        self.input_dtype = np.float16 if model_input.type == "tensor(float16)" else np.float32
+        # Exports either fix the batch dimension (usually to 1) or leave it symbolic
+        self.fixed_batch_size = model_input.shape[0] if isinstance(model_input.shape[0], int) else None
+        self.input_height, self.input_width = model_input.shape[2:]
+        self.output_names = [output.name for output in self.session.get_outputs()]
+        for name in (classes_output, scores_output):
+            if name not in self.output_names:
+                raise ValueError(
+                    f"{model_path} has no output named {name!r} (outputs: {', '.join(self.output_names)})"
+                )
+        self.classes_output = classes_output
+        self.scores_output = scores_output
+
+        # The export records the pixel layout it was trained on in its metadata
+        metadata = self.session.get_modelmeta().custom_metadata_map
+        self.is_bgr = metadata.get("Image.BitmapPixelFormat") == "Bgr8"
+        self.is_range255 = metadata.get("Image.NominalPixelRange") == "NominalRange_0_255"
+
+        with open(labels_path) as f:
+            self.labels = [line.strip() for line in f if line.strip()]
+
+        self.executor = executor
+        self.batch_scheduler = BatchScheduler(
+            self._detect_batch,
+            executor,
+            max_batch_size=max_batch_size,
+            batch_window_ms=batch_window_ms
+        )
+
+    def _to_input(self, data: bytes) -> np.ndarray:
+        image = Image.open(io.BytesIO(data)).convert("RGB")
+        image = image.resize((self.input_width, self.input_height), Image.BILINEAR)
+        array = np.asarray(image, dtype=np.float32).transpose((2, 0, 1))
+        if self.is_bgr:
+            array = array[::-1]
+        if not self.is_range255:
+            array = array / 255
+        return array.astype(self.input_dtype)
+
+    def _run(self, batch: np.ndarray):
+        return self.session.run(
+            [self.classes_output, self.scores_output], {self.input_name: batch}
+        )
+
+    def _detect_batch(self, images: List[bytes]) -> List[List[Tuple[str, float]]]:
+        inputs = np.stack([self._to_input(data) for data in images])
+        if self.fixed_batch_size is None:
+            classes, scores = self._run(inputs)
+        else:
+            results = []
+            for start in range(0, len(images), self.fixed_batch_size):
+                chunk = inputs[start:start + self.fixed_batch_size]
+                size = len(chunk)
+                if size < self.fixed_batch_size:
+                    # The model only takes full batches; pad with copies of the last image
+                    padding = np.repeat(chunk[-1:], self.fixed_batch_size - size, axis=0)
+                    chunk = np.concatenate([chunk, padding])
+                chunk_classes, chunk_scores = self._run(chunk)
+                results.append((chunk_classes[:size], chunk_scores[:size]))
+            classes = np.concatenate([result[0] for result in results])
+            scores = np.concatenate([result[1] for result in results])
+
+        return [
+            [
+                (self.labels[int(class_id)], float(score))
+                    for class_id, score in zip(image_classes, image_scores)
+            ]
+            for image_classes, image_scores in zip(classes, scores)
+        ]
+
+    async def detect(self, data: bytes) -> List[Tuple[str, float]]:
+        """
+        Returns (tag name, probability) for every object detected in the image.
+        """
+        return (await self.batch_scheduler.submit(data))[0]
+
+    def stats(self) -> dict:
+        return {
+            "executor": self.executor.stats(),
+            "batching": self.batch_scheduler.stats(),
+        }
@@ -0,0 +1,117 @@
+import numpy as np
+import jax
+import jax.numpy as jnp
+
+from transformers import FlaxLogitsProcessor
+
+from typing import List
+
+def banned_sequence_arrays(
+        banned_sequences_per_row: List[List[List[int]]],
+        max_sequences: int = 1,
+        max_tokens: int = 1
+    ):
+    """
+    Packs each row's banned token sequences into a (rows, sequences, tokens) array of
+    sequences, right-aligned and left-padded with -1 (which matches any token), and a
+    (rows, sequences) mask of which are in use. The arrays are at least max_sequences
+    by max_tokens, and grow to the next power of two when a row needs more, so most
+    allergy lists share one shape.
+    """
+    def fit(needed, minimum):
+        size = max(minimum, 1)
+        while size < needed:
+            size *= 2
+        return size
+
+    num_rows = len(banned_sequences_per_row)
+    num_sequences = fit(max([len(seqs) for seqs in banned_sequences_per_row] + [0]), max_sequences)
+    num_tokens = fit(
+        max([len(seq) for seqs in banned_sequences_per_row for seq in seqs] + [0]), max_tokens
+    )
+
+    banned = np.full((num_rows, num_sequences, num_tokens), -1, dtype=np.int32)
+    active = np.zeros((num_rows, num_sequences), dtype=bool)
+    for row, seqs in enumerate(banned_sequences_per_row):
+        for idx, seq in enumerate(seqs):
+            banned[row, idx, num_tokens - len(seq):] = seq
+            active[row, idx] = True
+    return banned, active
+
+class FlaxBannedSequencesLogitsProcessor(FlaxLogitsProcessor):
+    """
+    Stops each row of the batch from generating any of its own banned token sequences:
+    whenever the tokens generated so far end with all but the last token of a banned
+    sequence, that last token's score is set to -inf.
+
+    The sequences are given as arrays (see banned_sequence_arrays), which may be traced,
+    so a jitted generate function takes them as arguments instead of recompiling for
+    every set of banned words.
+    """
+
+    def __init__(self, banned_sequences: jnp.ndarray, active: jnp.ndarray):
+        self.prefix_length = banned_sequences.shape[-1] - 1
+        self.prefixes = banned_sequences[:, :, :-1]
+        self.last_tokens = jnp.where(active, banned_sequences[:, :, -1], 0)
+        self.active = active
+
+    @classmethod
+    def from_sequences(cls, banned_sequences_per_row: List[List[List[int]]]):
+        return cls(*(jnp.asarray(array) for array in banned_sequence_arrays(banned_sequences_per_row)))
+
+    def __call__(self, input_ids: jnp.ndarray, scores: jnp.ndarray, cur_len: int) -> jnp.ndarray:
+        batch_size = scores.shape[0]
+        # Beam search and num_return_sequences repeat each row of the batch
+        repeats = batch_size // self.active.shape[0]
+        prefixes = jnp.repeat(self.prefixes, repeats, axis=0)
+        last_tokens = jnp.repeat(self.last_tokens, repeats, axis=0)
+        active = jnp.repeat(self.active, repeats, axis=0)
+
+        if self.prefix_length > 0:
+            # Pad on the left so the window is well defined before enough tokens exist;
+            # -2 never matches a real token
+            padded = jnp.pad(
+                input_ids, ((0, 0), (self.prefix_length, 0)), constant_values=-2
+            )
+            window = jnp.take(
+                padded, cur_len + jnp.arange(self.prefix_length), axis=1
+            )
+            matches = jnp.all(
+                (prefixes == window[:, None, :]) | (prefixes == -1), axis=-1
+            )
+        else:
+            matches = jnp.ones_like(active)
+        matches = matches & active
+
+        rows = jnp.arange(batch_size)[:, None]
+        banned = jnp.zeros(scores.shape, dtype=jnp.int32).at[rows, last_tokens].max(
+            matches.astype(jnp.int32)
+        )
+        return jnp.where(banned > 0, -float("inf"), scores)
+
+class FlaxEarlyStopLogitsProcessor(FlaxLogitsProcessor):
+    """
+    Ends a row's decoding once it has started its final section (the recipe's
+    directions) and the model already gives EOS at least eos_probability, instead of
+    letting sampling run on towards max_length.
+    """
+
+    def __init__(self, section_token_ids: List[int], eos_token_id: int, eos_probability: float):
+        self.section_token_ids = jnp.asarray(section_token_ids, dtype=jnp.int32)
+        self.eos_token_id = eos_token_id
+        self.eos_probability = eos_probability
+
+    def __call__(self, input_ids: jnp.ndarray, scores: jnp.ndarray, cur_len: int) -> jnp.ndarray:
+        section_length = self.section_token_ids.shape[0]
+        positions = jnp.arange(input_ids.shape[1] - section_length + 1)
+        windows = jnp.take(input_ids, positions[:, None] + jnp.arange(section_length), axis=1)
+        found = jnp.all(windows == self.section_token_ids, axis=-1)
+        # Only look at tokens that have actually been generated
+        found = found & (positions + section_length <= cur_len)
+        in_final_section = jnp.any(found, axis=-1)
+
+        eos_probability = jax.nn.softmax(scores, axis=-1)[:, self.eos_token_id]
+        stop = in_final_section & (eos_probability >= self.eos_probability)
+
+        forced_eos = jnp.full_like(scores, -float("inf")).at[:, self.eos_token_id].set(0)
+        return jnp.where(stop[:, None], forced_eos, scores)
@@ -0,0 +1,247 @@
+import asyncio
+import os
+import resource
+import sys
+import threading
+import time
+
+from typing import AsyncIterator, List, Optional, Tuple, Union
+
+from .batch_scheduler import BatchScheduler
+from .inference_executor import InferenceExecutor
+from .recipe_cache import RecipeCache
+
+def _resident_memory_mb():
+    # Current resident set size, falling back to the peak RSS where /proc is unavailable
+    try:
+        with open("/proc/self/statm") as f:
+            resident_pages = int(f.read().split()[1])
+        return resident_pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, IndexError):
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is reported in bytes on macOS and kilobytes on Linux
+        if sys.platform == "darwin":
+            return max_rss / (1024 * 1024)
+        return max_rss / 1024
+
+class ModelRegistry:
+    """
+    Owns the process-wide RecipeGenerator so the T5 model is only loaded once
+    and shared across every dialog and conversation.
+    """
+
+    def __init__(
+        self,
+        generator_factory=None,
+        generator=None,
+        executor: InferenceExecutor = None,
+        max_batch_size: int = 8,
+        batch_window_ms: float = 20,
+        recipe_cache: RecipeCache = None,
+        num_candidates: int = 1,
+        num_results: int = 1
+    ):
+        self._generator_factory = generator_factory
+        self._generator = generator
+        # Candidates sampled per input in one batched decode, and how many of the
+        # best ranked ones are returned
+        self.num_candidates = max(num_candidates, num_results)
+        self.num_results = num_results
+        self.executor = executor or InferenceExecutor()
+        self.recipe_cache = recipe_cache
+        self.batch_scheduler = BatchScheduler(
+            self._generate_recipes, self.executor, max_batch_size, batch_window_ms
+        )
+        self.stream_scheduler = BatchScheduler(
+            self._stream_recipes, self.executor, max_batch_size, batch_window_ms
+        )
+        self._lock = threading.Lock()
+
+        self.load_time_seconds = None
+        self.load_memory_mb = None
+        self.warm_up_seconds = None
+        self.is_ready = False
+
+    @property
+    def is_loaded(self) -> bool:
+        return self._generator is not None
+
+    def load(self):
+        # Double-checked so concurrent first requests don't load the model twice
+        if self._generator is not None:
+            return self._generator
+        with self._lock:
+            if self._generator is None:
+                memory_before = _resident_memory_mb()
+                start = time.perf_counter()
+                generator_factory = self._generator_factory
+                if generator_factory is None:
+                    # Imported here so the registry can be used (e.g. with a stub
+                    # generator) without transformers and jax
+                    from .recipe_generation import RecipeGenerator
+                    generator_factory = RecipeGenerator
+                generator = generator_factory()
+                self.load_time_seconds = time.perf_counter() - start
+                self.load_memory_mb = _resident_memory_mb() - memory_before
+                self._generator = generator
+                print(
+                    f"Loaded recipe generator in {self.load_time_seconds:.2f}s "
+                    f"(+{self.load_memory_mb:.0f} MB resident)"
+                )
+        return self._generator
+
+    def warm_up(self, batch_sizes=None, stream=False):
+        # Load the model and compile its expected input shapes, then report ready. By
+        # default that's every batch the scheduler can form, which the generator rounds
+        # up to its batch buckets. With stream the streaming decode is compiled too.
+        generator = self.load()
+        start = time.perf_counter()
+        generator.warm_up(
+            batch_sizes or range(1, self.batch_scheduler.max_batch_size + 1),
+            num_candidates=self.num_candidates,
+            stream=stream
+        )
+        self.warm_up_seconds = time.perf_counter() - start
+        self.is_ready = True
+
+    async def generate_recipes(
+        self,
+        texts: Union[str, List[str]],
+        allergies: Optional[List[str]] = None
+    ) -> List[str]:
+        # Allergens are banned while decoding, so they are part of the cache key
+        cache_kwargs = {"num_candidates": self.num_candidates, "num_results": self.num_results}
+        if allergies:
+            cache_kwargs["allergies"] = sorted(allergies)
+
+        inputs = texts if isinstance(texts, list) else [texts]
+        # Only the prompts without cached recipes are generated
+        if self.recipe_cache is not None:
+            results_per_input = self.recipe_cache.get(inputs, cache_kwargs)
+        else:
+            results_per_input = [None] * len(inputs)
+        missing = [idx for idx, results in enumerate(results_per_input) if results is None]
+
+        if missing:
+            # Generation is blocking JAX code, so it is batched with other conversations'
+            # requests and run (along with any first-use load) off the event loop
+            missing_texts = [inputs[idx] for idx in missing]
+            generated = await self.batch_scheduler.submit(
+                missing_texts,
+                banned_words=allergies or None,
+                num_candidates=self.num_candidates,
+                num_results=self.num_results
+            )
+            for idx, results in zip(missing, generated):
+                results_per_input[idx] = results
+            if self.recipe_cache is not None:
+                self.recipe_cache.add(missing_texts, generated, cache_kwargs)
+
+        return [recipe for results in results_per_input for recipe in results]
+
+    async def stream_recipes(
+        self,
+        texts: Union[str, List[str]],
+        allergies: Optional[List[str]] = None
+    ) -> AsyncIterator[Tuple[int, str]]:
+        """
+        Yields (input index, section) for one recipe per input as its sections are
+        decoded. Like generate_recipes, inputs are batched with other conversations'
+        streams and the recipes are cached per input; cached recipes are yielded
+        straight away and only the others are decoded.
+        """
+        inputs = texts if isinstance(texts, list) else [texts]
+        # Only the best candidate of each input can be streamed
+        cache_kwargs = {"num_candidates": self.num_candidates, "num_results": 1}
+        if allergies:
+            cache_kwargs["allergies"] = sorted(allergies)
+
+        missing = list(range(len(inputs)))
+        if self.recipe_cache is not None:
+            cached = self.recipe_cache.get(inputs, cache_kwargs)
+            missing = [idx for idx, results in enumerate(cached) if results is None]
+            for idx, results in enumerate(cached):
+                if results is not None:
+                    for section in results[0].split("\n"):
+                        yield idx, section
+        if not missing:
+            return
+
+        loop = asyncio.get_running_loop()
+        sections = asyncio.Queue()
+
+        def on_section(idx):
+            # Called on the inference executor as each section of input idx is decoded
+            return lambda section: loop.call_soon_threadsafe(sections.put_nowait, (idx, section))
+
+        # One request per input, so each carries its own callback; they still end up in
+        # the same batch
+        task = asyncio.ensure_future(asyncio.gather(*(
+            self.stream_scheduler.submit(
+                inputs[idx],
+                banned_words=allergies or None,
+                num_candidates=self.num_candidates,
+                on_section=on_section(idx)
+            )
+            for idx in missing
+        )))
+        # Runs on the loop after every queued section, so it always arrives last
+        task.add_done_callback(lambda _: sections.put_nowait(None))
+
+        while True:
+            item = await sections.get()
+            if item is None:
+                break
+            yield item
+        # Surface any error raised while decoding
+        results_per_input = [outputs[0] for outputs in await task]
+        if self.recipe_cache is not None:
+            self.recipe_cache.add([inputs[idx] for idx in missing], results_per_input, cache_kwargs)
+
+    def _generate_recipes(self, texts, banned_words=None, num_candidates=None, num_results=None):
+        # Returns the best ranked recipes for each input, as one list per input
+        return self.load().generate_candidates(
+            texts,
+            banned_words=banned_words,
+            num_candidates=num_candidates or 1,
+            num_results=num_results or 1
+        )
+
+    def _stream_recipes(self, texts, banned_words=None, num_candidates=None, on_section=None):
+        # Streams the batch's recipes, handing each section to its input's callback, and
+        # returns each input's whole recipe as its only result
+        sections_per_input = [[] for _ in texts]
+        for idx, section in self.load().stream_generation(
+            texts,
+            banned_words=banned_words,
+            num_candidates=num_candidates or 1
+        ):
+            sections_per_input[idx].append(section)
+            on_section[idx](section)
+        return [["\n".join(sections)] for sections in sections_per_input]
+
+    def set_generator(self, generator):
+        # Swap in a stand-in generator, e.g. a stub in tests
+        with self._lock:
+            self._generator = generator
+            self.load_time_seconds = None
+            self.load_memory_mb = None
+            self.is_ready = generator is not None
+
+    def stats(self) -> dict:
+        return {
+            "loaded": self.is_loaded,
+            "ready": self.is_ready,
+            "warm_up_seconds": self.warm_up_seconds,
+            "load_time_seconds": self.load_time_seconds,
+            "load_memory_mb": self.load_memory_mb,
+            "decode_usage": (
+                self._generator.usage_stats()
+                if hasattr(self._generator, "usage_stats") else None
+            ),
+            "resident_memory_mb": _resident_memory_mb(),
+            "executor": self.executor.stats(),
+            "batching": self.batch_scheduler.stats(),
+            "stream_batching": self.stream_scheduler.stats(),
+            "recipe_cache": self.recipe_cache.stats() if self.recipe_cache is not None else None,
+        }
@@ -0,0 +1,177 @@
+import json
+import random
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from typing import List, Optional, Tuple
+
+class MemoryCacheBackend:
+    """
+    In-process cache store. Entries are kept in least-recently-used order.
+    """
+
+    def __init__(self):
+        self._entries = OrderedDict()
+
+    def get(self, key: str) -> Optional[Tuple[float, list]]:
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+        return entry
+
+    def set(self, key: str, created_at: float, pool: list):
+        self._entries[key] = (created_at, pool)
+        self._entries.move_to_end(key)
+
+    def delete(self, key: str):
+        self._entries.pop(key, None)
+
+    def pop_least_recently_used(self):
+        self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+class DiskCacheBackend:
+    """
+    Local on-disk cache store backed by SQLite, so cached recipes survive restarts.
+    """
+
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS recipe_cache ("
+                "key TEXT PRIMARY KEY, created_at REAL, accessed_at REAL, pool TEXT)"
+            )
+
+    def get(self, key: str) -> Optional[Tuple[float, list]]:
+        with self._lock, self._connection:
+            row = self._connection.execute(
+                "SELECT created_at, pool FROM recipe_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            self._connection.execute(
+                "UPDATE recipe_cache SET accessed_at = ? WHERE key = ?", (time.time(), key)
+            )
+        return row[0], json.loads(row[1])
+
+    def set(self, key: str, created_at: float, pool: list):
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO recipe_cache (key, created_at, accessed_at, pool) "
+                "VALUES (?, ?, ?, ?)",
+                (key, created_at, time.time(), json.dumps(pool))
+            )
+
+    def delete(self, key: str):
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM recipe_cache WHERE key = ?", (key,))
+
+    def pop_least_recently_used(self):
+        with self._lock, self._connection:
+            self._connection.execute(
+                "DELETE FROM recipe_cache WHERE key = "
+                "(SELECT key FROM recipe_cache ORDER BY accessed_at LIMIT 1)"
+            )
+
+    def __len__(self):
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM recipe_cache").fetchone()[0]
+
+class RecipeCache:
+    """
+    Caches generated recipes per prompt, keyed by the normalized prompt and the
+    generation kwargs, so a request only decodes the prompts that aren't cached yet.
+    Each key holds a pool of up to pool_size generations; once the pool is full a
+    random one is served, so sampling variety is kept.
+    """
+
+    def __init__(
+        self,
+        backend=None,
+        max_entries: int = 1024,
+        ttl_seconds: float = 24 * 60 * 60,
+        pool_size: int = 3
+    ):
+        self.backend = backend if backend is not None else MemoryCacheBackend()
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.pool_size = pool_size
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        return " ".join(text.lower().split())
+
+    def make_key(self, text: str, generation_kwargs: dict) -> str:
+        return json.dumps(
+            {"input": self.normalize(text), "kwargs": generation_kwargs}, sort_keys=True
+        )
+
+    def get(self, texts, generation_kwargs: dict = None) -> List[Optional[list]]:
+        """
+        Returns the cached results for each prompt, or None for the prompts that still
+        need generating.
+        """
+        inputs = texts if isinstance(texts, list) else [texts]
+        return [self._get_one(text, generation_kwargs or {}) for text in inputs]
+
+    def _get_one(self, text: str, generation_kwargs: dict) -> Optional[list]:
+        key = self.make_key(text, generation_kwargs)
+
+        entry = self.backend.get(key)
+        if entry is not None and time.time() - entry[0] > self.ttl_seconds:
+            self.backend.delete(key)
+            self.expirations += 1
+            entry = None
+
+        # Keep generating until the pool is full, so repeat users still see variety
+        if entry is None or len(entry[1]) < self.pool_size:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return random.choice(entry[1])
+
+    def add(self, texts, results_per_input: list, generation_kwargs: dict = None):
+        inputs = texts if isinstance(texts, list) else [texts]
+        if len(results_per_input) != len(inputs):
+            return
+        for text, results in zip(inputs, results_per_input):
+            key = self.make_key(text, generation_kwargs or {})
+
+            entry = self.backend.get(key)
+            if entry is None or time.time() - entry[0] > self.ttl_seconds:
+                created_at, pool = time.time(), []
+            else:
+                created_at, pool = entry
+            pool = (pool + [results])[-self.pool_size:]
+            self.backend.set(key, created_at, pool)
+
+        while len(self.backend) > self.max_entries:
+            self.backend.pop_least_recently_used()
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "backend": type(self.backend).__name__,
+            "entries": len(self.backend),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "pool_size": self.pool_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else None,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
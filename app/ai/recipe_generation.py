@@ -1,5 +1,57 @@
+import os
+import threading
+import time
+from collections import deque
+
 from transformers import FlaxAutoModelForSeq2SeqLM
 from transformers import AutoTokenizer
+from transformers import (
+    FlaxLogitsProcessorList,
+    FlaxMinLengthLogitsProcessor,
+    FlaxTopKLogitsWarper,
+    FlaxTopPLogitsWarper
+)
+try:
+    from transformers import FlaxNoRepeatNGramLogitsProcessor
+except ImportError:
+    # Only available in newer transformers releases
+    FlaxNoRepeatNGramLogitsProcessor = None
+
+import jax
+import jax.numpy as jnp
+import numpy as np
+
+from .logits_processors import (
+    FlaxBannedSequencesLogitsProcessor,
+    FlaxEarlyStopLogitsProcessor,
+    banned_sequence_arrays
+)
+
+from typing import List, Optional, Union
+
+# Inputs are padded up to the smallest bucket that fits the longest prompt in the batch,
+# which keeps encoder work proportional to the prompt while bounding the number of
+# distinct input shapes JAX has to compile.
+DEFAULT_LENGTH_BUCKETS = (16, 32, 64, 128, 256)
+
+# Batches are padded up to one of these numbers of inputs (then to multiples of the
+# largest), so batches of any size up to it only compile a few shapes
+DEFAULT_BATCH_BUCKETS = (1, 2, 4, 8)
+
+def enable_compilation_cache(cache_dir: str):
+    """
+    Persist XLA executables on disk so restarts and scaled-out replicas sharing
+    cache_dir can skip recompiling model.generate.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    try:
+        jax.config.update("jax_compilation_cache_dir", cache_dir)
+        # Cache every executable, not only those that were slow to compile
+        jax.config.update("jax_persistent_cache_min_compile_time_secs", 0)
+    except AttributeError:
+        # Older jax releases only expose the experimental API
+        from jax.experimental.compilation_cache import compilation_cache
+        compilation_cache.initialize_cache(cache_dir)
 
 class RecipeGenerator:
     
@@ -10,13 +62,30 @@ class RecipeGenerator:
             no_repeat_ngram_size = 3,
             do_sample = True,
             top_k = 60,
-            top_p = 0.95
+            top_p = 0.95,
+            max_input_length = 256,
+            length_buckets = DEFAULT_LENGTH_BUCKETS,
+            batch_buckets = DEFAULT_BATCH_BUCKETS,
+            early_stop_eos_probability = 0.25,
+            stream_sync_tokens = 8,
+            max_banned_sequences = 32,
+            max_banned_tokens = 8
         ):
         self.MODEL_NAME_OR_PATH = "flax-community/t5-recipe-generation"
         self.tokenizer = AutoTokenizer.from_pretrained(self.MODEL_NAME_OR_PATH, use_fast=True)
         self.model = FlaxAutoModelForSeq2SeqLM.from_pretrained(self.MODEL_NAME_OR_PATH)
 
         self.prefix = "items: "
+        self.max_input_length = max_input_length
+        # With no buckets every prompt is padded to max_input_length
+        self.length_buckets = sorted(
+            bucket for bucket in (length_buckets or ()) if bucket < max_input_length
+        ) + [max_input_length]
+
+        # Every recipe may use up to max_length tokens; the early stop processor ends
+        # it as soon as it is complete
+        self.early_stop_eos_probability = early_stop_eos_probability
+        self.batch_buckets = sorted(batch_buckets or (1,))
 
         self.generation_kwargs = {
             "max_length": max_length,
@@ -27,6 +96,40 @@ class RecipeGenerator:
             "top_p": top_p
         }
 
+        # Banned token sequences are cached per allergy set so they are only tokenized once
+        self._banned_sequences_cache = {}
+        self._banned_sequences_lock = threading.Lock()
+        # They are padded to at least this many sequences of this many tokens, so every
+        # usual allergy list is passed to the compiled generate function in one shape
+        self.max_banned_sequences = max_banned_sequences
+        self.max_banned_tokens = max_banned_tokens
+
+        # Each generate call gets its own PRNG key so repeated and batched rows sample
+        # different recipes
+        self._prng_key = jax.random.PRNGKey(int.from_bytes(os.urandom(4), "little"))
+        self._prng_lock = threading.Lock()
+
+        # Decoding stops early once the directions section has started and EOS is likely
+        self._final_section_token_ids = self.tokenizer(
+            "directions:", add_special_tokens=False
+        ).input_ids
+
+        # Tokens generated versus the decode budget, overall and for recent requests
+        self._usage_lock = threading.Lock()
+        self.tokens_generated = 0
+        self.tokens_budgeted = 0
+        self.recent_usage = deque(maxlen=100)
+
+        # model.generate compiled once per input shape. The generation kwargs are fixed
+        # for the generator, so they are closed over as static values, while the params,
+        # PRNG key and banned sequences are traced arguments.
+        self._generate_step = jax.jit(self._generate_fn)
+
+        # Compiled single decoding step used by stream_generation, which only copies the
+        # decoded tokens back to the host every stream_sync_tokens steps
+        self._decode_step = jax.jit(self._decode_step_fn)
+        self.stream_sync_tokens = max(stream_sync_tokens, 1)
+
         self.special_tokens = self.tokenizer.all_special_tokens
         self.tokens_map = {
             "<sep>": "--",
@@ -54,28 +157,432 @@ class RecipeGenerator:
 
         return new_texts
 
-    def generation_function(self, texts):
+    def bucket_length(self, length):
+        for bucket in self.length_buckets:
+            if length <= bucket:
+                return bucket
+        return self.max_input_length
+
+    def bucket_batch_size(self, size):
+        for bucket in self.batch_buckets:
+            if size <= bucket:
+                return bucket
+        largest = self.batch_buckets[-1]
+        return -(-size // largest) * largest
+
+    def tokenize(self, texts, pad_to=None):
         _inputs = texts if isinstance(texts, list) else [texts]
         inputs = [self.prefix + inp for inp in _inputs]
-        inputs = self.tokenizer(
-            inputs, 
-            max_length=256, 
-            padding="max_length", 
-            truncation=True, 
+        encoded = self.tokenizer(
+            inputs,
+            max_length=self.max_input_length,
+            truncation=True
+        )
+        longest = max(len(ids) for ids in encoded["input_ids"])
+        return self.tokenizer.pad(
+            encoded,
+            padding="max_length",
+            max_length=pad_to or self.bucket_length(longest),
             return_tensors="jax"
         )
 
+    def banned_sequences(self, banned_words: Optional[List[str]]) -> List[List[int]]:
+        if not banned_words:
+            return []
+        key = frozenset(word.strip().lower() for word in banned_words if word.strip())
+        with self._banned_sequences_lock:
+            if key not in self._banned_sequences_cache:
+                sequences = set()
+                for word in key:
+                    # Cover the spellings the model is likely to produce for each word
+                    for variant in {word, word.capitalize(), word + "s", word.capitalize() + "s"}:
+                        token_ids = self.tokenizer(variant, add_special_tokens=False).input_ids
+                        if token_ids:
+                            sequences.add(tuple(token_ids))
+                self._banned_sequences_cache[key] = [list(seq) for seq in sequences]
+            return self._banned_sequences_cache[key]
+
+    def _banned_arrays(self, banned_words_per_row, num_rows):
+        # Every row gets an entry, even with nothing banned, so the arrays' shape only
+        # depends on the batch
+        banned_words_per_row = banned_words_per_row or [None] * num_rows
+        return banned_sequence_arrays(
+            [self.banned_sequences(words) for words in banned_words_per_row],
+            self.max_banned_sequences,
+            self.max_banned_tokens
+        )
+
+    def _logits_processors(self, banned_sequences=None, banned_active=None) -> FlaxLogitsProcessorList:
+        processors = FlaxLogitsProcessorList()
+        if banned_sequences is not None:
+            processors.append(FlaxBannedSequencesLogitsProcessor(banned_sequences, banned_active))
+        if self.early_stop_eos_probability and self._final_section_token_ids:
+            processors.append(FlaxEarlyStopLogitsProcessor(
+                self._final_section_token_ids,
+                self.model.config.eos_token_id,
+                self.early_stop_eos_probability
+            ))
+        return processors
+
+    def _record_usage(self, sequences, budgets):
+        # A row's generated tokens run from after the decoder start token up to its EOS
+        sequences = np.asarray(sequences)[:, 1:]
+        finished = sequences == self.model.config.eos_token_id
+        generated = np.where(
+            finished.any(axis=1), finished.argmax(axis=1) + 1, sequences.shape[1]
+        )
+        with self._usage_lock:
+            for tokens, budget in zip(generated.tolist(), budgets):
+                self.tokens_generated += tokens
+                self.tokens_budgeted += budget
+                self.recent_usage.append((tokens, budget))
+
+    def usage_stats(self) -> dict:
+        with self._usage_lock:
+            return {
+                "tokens_generated": self.tokens_generated,
+                "tokens_budgeted": self.tokens_budgeted,
+                "budget_utilization": (
+                    self.tokens_generated / self.tokens_budgeted if self.tokens_budgeted else None
+                ),
+                "recent": [
+                    {"tokens_generated": tokens, "budget": budget}
+                    for tokens, budget in self.recent_usage
+                ],
+            }
+
+    def _next_prng_key(self):
+        with self._prng_lock:
+            self._prng_key, key = jax.random.split(self._prng_key)
+        return key
+
+    def _repeat_candidates(self, inputs, banned_words_per_input=None, num_candidates_per_input=None):
         input_ids = inputs.input_ids
         attention_mask = inputs.attention_mask
+        if num_candidates_per_input and any(count > 1 for count in num_candidates_per_input):
+            # Repeat each input once per candidate so every candidate is sampled in the same
+            # batched decode; rows for the same input stay next to each other
+            repeats = np.asarray(num_candidates_per_input)
+            total_rows = int(repeats.sum())
+            input_ids = jnp.repeat(input_ids, repeats, axis=0, total_repeat_length=total_rows)
+            attention_mask = jnp.repeat(
+                attention_mask, repeats, axis=0, total_repeat_length=total_rows
+            )
+            if banned_words_per_input:
+                banned_words_per_input = [
+                    words
+                    for words, count in zip(banned_words_per_input, num_candidates_per_input)
+                    for _ in range(count)
+                ]
+        return input_ids, attention_mask, banned_words_per_input
 
+    def _prepare_batch(self, texts, banned_words=None, num_candidates: Union[int, List[int]] = 1):
+        # Returns the inputs, banned words and candidate counts padded up to the batch
+        # bucket, with the number of real inputs. Padding copies the last input, so only
+        # the warmed up batch shapes are compiled; callers drop the padding rows.
+        _inputs = texts if isinstance(texts, list) else [texts]
+        if banned_words and all(isinstance(word, str) for word in banned_words):
+            banned_words = [banned_words] * len(_inputs)
+        if not isinstance(num_candidates, list):
+            num_candidates = [num_candidates] * len(_inputs)
+        num_candidates = [max(count or 1, 1) for count in num_candidates]
+
+        num_inputs = len(_inputs)
+        padding = self.bucket_batch_size(num_inputs) - num_inputs
+        if padding:
+            _inputs = _inputs + [_inputs[-1]] * padding
+            num_candidates = num_candidates + [num_candidates[-1]] * padding
+            if banned_words:
+                banned_words = banned_words + [[]] * padding
+        return _inputs, banned_words, num_candidates, num_inputs
+
+    def generate(
+            self,
+            inputs,
+            banned_words_per_input=None,
+            num_candidates_per_input=None
+        ):
+        input_ids, attention_mask, banned_words_per_row = self._repeat_candidates(
+            inputs, banned_words_per_input, num_candidates_per_input
+        )
+        banned_sequences, banned_active = self._banned_arrays(
+            banned_words_per_row, input_ids.shape[0]
+        )
+
+        return self._generate_step(
+            self.model.params,
+            input_ids,
+            attention_mask,
+            self._next_prng_key(),
+            banned_sequences,
+            banned_active
+        )
+
+    def _generate_fn(self, params, input_ids, attention_mask, prng_key, banned_sequences, banned_active):
         output_ids = self.model.generate(
-            input_ids=input_ids, 
+            input_ids=input_ids,
             attention_mask=attention_mask,
+            params=params,
+            prng_key=prng_key,
+            logits_processor=self._logits_processors(banned_sequences, banned_active),
             **self.generation_kwargs
         )
-        generated = output_ids.sequences
-        generated_recipe = self.target_postprocessing(
+        return output_ids.sequences
+
+    @staticmethod
+    def rank_candidates(candidates: List[str], banned_words: Optional[List[str]] = None) -> List[str]:
+        # Prefer candidates without banned words, then complete recipes, then those
+        # with the fewest repeated ingredients/steps
+        banned_words = [word.lower() for word in banned_words or []]
+
+        def rank(text):
+            lowered = text.lower()
+            has_banned = any(word in lowered for word in banned_words)
+            missing_sections = sum(
+                section not in lowered for section in ("title:", "ingredients:", "directions:")
+            )
+            items = [item.strip() for item in lowered.replace("\n", "--").split("--") if item.strip()]
+            repeated_items = len(items) - len(set(items))
+            return (has_banned, missing_sections, repeated_items)
+
+        return sorted(candidates, key=rank)
+
+    def warm_up(self, batch_sizes=None, num_candidates=1, stream=False):
+        # Trace and compile the jitted model.generate for every input shape we expect to serve,
+        # so no real request pays for compilation. Batch sizes are rounded up to their
+        # bucket, exactly as generate_candidates pads them. With stream, the decoding
+        # step stream_generation uses is compiled for the same shapes.
+        batch_buckets = sorted({
+            self.bucket_batch_size(size) for size in (batch_sizes or self.batch_buckets)
+        })
+        for batch_size in batch_buckets:
+            for bucket in self.length_buckets:
+                start = time.perf_counter()
+                self.generate(
+                    self.tokenize(["warm up"] * batch_size, pad_to=bucket),
+                    num_candidates_per_input=[num_candidates] * batch_size
+                )
+                print(
+                    f"Warmed up recipe generator for batch {batch_size} x {num_candidates} "
+                    f"candidates x {bucket} tokens in {time.perf_counter() - start:.2f}s"
+                )
+                if stream:
+                    start = time.perf_counter()
+                    # A couple of host syncs are enough to compile every step
+                    for _ in self.stream_generation(
+                        ["warm up"] * batch_size,
+                        num_candidates=num_candidates,
+                        pad_to=bucket,
+                        max_steps=2 * self.stream_sync_tokens
+                    ):
+                        pass
+                    print(
+                        f"Warmed up recipe streaming for batch {batch_size} x {num_candidates} "
+                        f"candidates x {bucket} tokens in {time.perf_counter() - start:.2f}s"
+                    )
+
+    def generate_candidates(
+            self,
+            texts,
+            banned_words=None,
+            num_candidates: Union[int, List[int]] = 1,
+            num_results: Union[int, List[int]] = 1
+        ) -> List[List[str]]:
+        """
+        Samples num_candidates recipes per input in a single batched decode, ranks them
+        and returns the best num_results for each input.
+
+        banned_words is either one list of words (e.g. a user's allergies) banned for
+        every input, or a list holding a separate list of words for each input. The
+        counts may likewise be a single int or one value per input.
+        """
+        _inputs, banned_words, num_candidates, num_inputs = self._prepare_batch(
+            texts, banned_words, num_candidates
+        )
+        if not isinstance(num_results, list):
+            num_results = [num_results] * num_inputs
+        num_results = [max(count or 1, 1) for count in num_results]
+        num_rows = sum(num_candidates[:num_inputs])
+
+        inputs = self.tokenize(_inputs)
+        generated = self.generate(inputs, banned_words, num_candidates)[:num_rows]
+        self._record_usage(generated, [self.generation_kwargs["max_length"]] * num_rows)
+        generated_recipes = self.target_postprocessing(
             self.tokenizer.batch_decode(generated, skip_special_tokens=False),
             self.special_tokens
         )
-        return generated_recipe
\ No newline at end of file
+
+        results = []
+        offset = 0
+        for idx, count in enumerate(num_candidates[:num_inputs]):
+            candidates = generated_recipes[offset:offset + count]
+            offset += count
+            ranked = self.rank_candidates(candidates, banned_words[idx] if banned_words else None)
+            results.append(ranked[:num_results[idx]])
+        return results
+
+    def _decode_step_fn(self, params, token, model_kwargs):
+        outputs = self.model.decode(token, params=params, **model_kwargs)
+        return outputs.logits[:, -1], self.model.update_inputs_for_generation(outputs, model_kwargs)
+
+    def _streaming_logits_processor(self, banned_words_per_row, num_rows):
+        # Mirrors the processors model.generate builds from generation_kwargs
+        processors = FlaxLogitsProcessorList()
+        if self.generation_kwargs.get("min_length"):
+            processors.append(FlaxMinLengthLogitsProcessor(
+                self.generation_kwargs["min_length"], self.model.config.eos_token_id
+            ))
+        if self.generation_kwargs.get("no_repeat_ngram_size") and FlaxNoRepeatNGramLogitsProcessor:
+            processors.append(
+                FlaxNoRepeatNGramLogitsProcessor(self.generation_kwargs["no_repeat_ngram_size"])
+            )
+        processors.extend(self._logits_processors(
+            *(jnp.asarray(array) for array in self._banned_arrays(banned_words_per_row, num_rows))
+        ))
+        if self.generation_kwargs.get("do_sample"):
+            if self.generation_kwargs.get("top_k"):
+                processors.append(FlaxTopKLogitsWarper(self.generation_kwargs["top_k"]))
+            if self.generation_kwargs.get("top_p", 1.0) < 1.0:
+                processors.append(FlaxTopPLogitsWarper(self.generation_kwargs["top_p"]))
+        return processors
+
+    def _decode_section(self, token_ids):
+        text = self.tokenizer.decode(token_ids, skip_special_tokens=False)
+        return self.target_postprocessing(text, self.special_tokens)[0].strip()
+
+    def stream_generation(
+            self,
+            texts,
+            banned_words=None,
+            num_candidates: Union[int, List[int]] = 1,
+            pad_to=None,
+            max_steps=None
+        ):
+        """
+        Decodes recipes for a batch of inputs step by step and yields (input index,
+        section) as each section ("title: ...", "ingredients: ...", "directions: ...")
+        is complete. num_candidates recipes are sampled per input; once all of them
+        have their title and ingredients the best ranked one is picked, and only its
+        sections are yielded. banned_words and num_candidates are given as for
+        generate_candidates; pad_to and max_steps fix the input length and cut decoding
+        short, e.g. for warm-up.
+        """
+        _inputs, banned_words, num_candidates, num_inputs = self._prepare_batch(
+            texts, banned_words, num_candidates
+        )
+        max_length = self.generation_kwargs["max_length"]
+        config = self.model.config
+        section_token_id = self.tokenizer.convert_tokens_to_ids("<section>")
+        if section_token_id == self.tokenizer.unk_token_id:
+            # Without a section marker a whole recipe is yielded once EOS is reached
+            section_token_id = None
+
+        input_ids, attention_mask, banned_words_per_row = self._repeat_candidates(
+            self.tokenize(_inputs, pad_to=pad_to), banned_words, num_candidates
+        )
+        num_rows = input_ids.shape[0]
+        rows_per_input = []
+        for count in num_candidates:
+            first_row = sum(len(rows) for rows in rows_per_input)
+            rows_per_input.append(list(range(first_row, first_row + count)))
+
+        encoder_outputs = self.model.encode(
+            input_ids, attention_mask=attention_mask, return_dict=True
+        )
+        token = jnp.full((num_rows, 1), config.decoder_start_token_id, dtype=jnp.int32)
+        sequence = jnp.full((num_rows, max_length), config.pad_token_id, dtype=jnp.int32)
+        sequence = sequence.at[:, 0].set(config.decoder_start_token_id)
+        model_kwargs = self.model.prepare_inputs_for_generation(
+            token,
+            max_length,
+            attention_mask=attention_mask,
+            encoder_outputs=encoder_outputs
+        )
+        logits_processor = self._streaming_logits_processor(banned_words_per_row, num_rows)
+        prng_key = self._next_prng_key()
+
+        # Per row: its completed sections, the token ids of the section in progress and
+        # whether it reached EOS. Per input: the chosen candidate row and how many of
+        # its sections have been yielded.
+        row_sections = [[] for _ in range(num_rows)]
+        row_section_ids = [[] for _ in range(num_rows)]
+        row_finished = [False] * num_rows
+        selected_rows = [None] * num_inputs
+        yielded = [0] * num_inputs
+
+        def end_section(row):
+            section = self._decode_section(row_section_ids[row])
+            row_section_ids[row] = []
+            if section:
+                row_sections[row].append(section)
+
+        def ready_sections():
+            for idx in range(num_inputs):
+                if selected_rows[idx] is None:
+                    candidates = rows_per_input[idx]
+                    if not all(
+                        row_finished[row]
+                        or any(section.startswith("ingredients:") for section in row_sections[row])
+                        for row in candidates
+                    ):
+                        continue
+                    candidate_texts = ["\n".join(row_sections[row]) for row in candidates]
+                    ranked = self.rank_candidates(
+                        candidate_texts, banned_words[idx] if banned_words else None
+                    )
+                    selected_rows[idx] = candidates[candidate_texts.index(ranked[0])]
+                sections = row_sections[selected_rows[idx]]
+                for section in sections[yielded[idx]:]:
+                    yield idx, section
+                yielded[idx] = len(sections)
+
+        synced_len = 1
+        last_step = min(max_steps + 1, max_length) if max_steps else max_length
+        for cur_len in range(1, last_step):
+            logits, model_kwargs = self._decode_step(self.model.params, token, model_kwargs)
+            scores = logits_processor(sequence, logits, cur_len)
+            if self.generation_kwargs.get("do_sample"):
+                prng_key, step_key = jax.random.split(prng_key)
+                next_token = jax.random.categorical(step_key, scores, axis=-1)
+            else:
+                next_token = jnp.argmax(scores, axis=-1)
+            next_token = next_token.astype(jnp.int32)
+            sequence = sequence.at[:, cur_len].set(next_token)
+            token = next_token[:, None]
+
+            # Steps are dispatched without waiting on the device; the new tokens are only
+            # copied back every stream_sync_tokens steps to look for section ends
+            if cur_len + 1 - synced_len < self.stream_sync_tokens and cur_len < last_step - 1:
+                continue
+            new_tokens = np.asarray(sequence[:, synced_len:cur_len + 1])
+            synced_len = cur_len + 1
+            for row in range(num_rows):
+                for token_id in new_tokens[row].tolist():
+                    if row_finished[row]:
+                        break
+                    if token_id in (section_token_id, config.eos_token_id):
+                        end_section(row)
+                        row_finished[row] = token_id == config.eos_token_id
+                    else:
+                        row_section_ids[row].append(token_id)
+
+            yield from ready_sections()
+            if all(row is not None and row_finished[row] for row in selected_rows):
+                break
+        else:
+            # Ran out of length before EOS; hand over whatever was decoded
+            for row in range(num_rows):
+                if not row_finished[row]:
+                    end_section(row)
+                    row_finished[row] = True
+            yield from ready_sections()
+
+        self._record_usage(
+            np.asarray(sequence)[selected_rows], [max_length] * num_inputs
+        )
+
+    def generation_function(self, texts, banned_words=None):
+        return [
+            candidates[0]
+            for candidates in self.generate_candidates(texts, banned_words=banned_words)
+        ]
\ No newline at end of file
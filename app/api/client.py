@@ -0,0 +1,79 @@
+import asyncio
+
+import aiohttp
+
+class ApiError(Exception):
+    """
+    Raised when the Functions API answers with an error status.
+    """
+
+    def __init__(self, status: int, path: str):
+        super().__init__(f"HTTP {status} from {path}")
+        self.status = status
+        self.path = path
+
+class ApiClient:
+    """
+    Async client for the user/allergy/preference Functions API. All calls share one
+    keep-alive connection pool, are bounded by a timeout, and at most max_concurrency
+    requests are in flight at once.
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        timeout_seconds: float = 10,
+        max_connections: int = 20,
+        max_concurrency: int = 20,
+        keepalive_seconds: float = 60
+    ):
+        self.base_url = base_url
+        self.timeout = aiohttp.ClientTimeout(total=timeout_seconds)
+        self.max_connections = max_connections
+        self.max_concurrency = max_concurrency
+        self.keepalive_seconds = keepalive_seconds
+
+        # Created lazily, as both need to belong to the running event loop
+        self._session = None
+        self._semaphore = None
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.max_connections,
+                keepalive_timeout=self.keepalive_seconds
+            )
+            self._session = aiohttp.ClientSession(connector=connector, timeout=self.timeout)
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._session
+
+    async def request(self, method: str, path: str, **kwargs):
+        """
+        Returns the response status, headers and parsed JSON body. The body is only
+        parsed for 2xx responses; it is None when empty and for every other status,
+        as error pages from the Functions host aren't necessarily JSON.
+        """
+        session = self._get_session()
+        async with self._semaphore:
+            async with session.request(method, self.base_url + path, **kwargs) as response:
+                if not 200 <= response.status < 300:
+                    return response.status, response.headers, None
+                content = await response.read()
+                body = await response.json(content_type=None) if content else None
+                return response.status, response.headers, body
+
+    async def get_json(self, path: str):
+        status, _, body = await self.request("GET", path)
+        if status >= 400:
+            raise ApiError(status, path)
+        return body
+
+    async def post_json(self, path: str, body):
+        status, _, response_body = await self.request("POST", path, json=body)
+        if status >= 400:
+            raise ApiError(status, path)
+        return response_body
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
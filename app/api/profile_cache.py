@@ -0,0 +1,83 @@
+import time
+from collections import OrderedDict
+
+from typing import Any, Awaitable, Callable, Hashable
+
+class ProfileCache:
+    """
+    Read-through cache for user and allergy lookups. Missing users are cached too
+    (for the shorter negative_ttl_seconds) so unknown ids don't hit the API every join.
+    """
+
+    def __init__(
+        self,
+        ttl_seconds: float = 300,
+        negative_ttl_seconds: float = 30,
+        max_entries: int = 10000
+    ):
+        self.ttl_seconds = ttl_seconds
+        self.negative_ttl_seconds = negative_ttl_seconds
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, key: Hashable):
+        """
+        Returns (found, value); found is False when the key is missing or expired.
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            return False, None
+        expires_at, value = entry
+        if time.monotonic() >= expires_at:
+            del self._entries[key]
+            return False, None
+        self._entries.move_to_end(key)
+        return True, value
+
+    def set(self, key: Hashable, value: Any, ttl_seconds: float = None):
+        ttl = ttl_seconds
+        if ttl is None:
+            ttl = self.negative_ttl_seconds if value is None else self.ttl_seconds
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, key: Hashable):
+        if self._entries.pop(key, None) is not None:
+            self.invalidations += 1
+
+    def get_many(self, keys):
+        """
+        Returns (found, values); found is True only when every key is cached.
+        """
+        results = [self.get(key) for key in keys]
+        if all(found for found, _ in results):
+            self.hits += 1
+            return True, [value for _, value in results]
+        self.misses += 1
+        return False, None
+
+    async def get_or_load(self, key: Hashable, load: Callable[[], Awaitable[Any]]):
+        found, value = self.get(key)
+        if found:
+            self.hits += 1
+            return value
+        self.misses += 1
+        value = await load()
+        self.set(key, value)
+        return value
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else None,
+            "invalidations": self.invalidations,
+        }
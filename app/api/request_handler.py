@@ -1,59 +1,252 @@
-import requests
-import urllib.parse
+import asyncio
+import hashlib
 import json
+import sys
+import urllib.parse
+
+import aiohttp
 
 from config import DefaultConfig
+from .client import ApiClient, ApiError
+from .profile_cache import ProfileCache
+from .write_behind import WriteBehindQueue
 
 from typing import List
 
-def get_user(id: str):
-    
-    parsed_id = urllib.parse.quote(id)
-    url = DefaultConfig.API_BASE_URL + "users/" + parsed_id
-    response = requests.get(url)
-    try:
-        user = json.loads(response.content)[0]
-    except IndexError:
-        user = None
+# One pooled client shared by every conversation
+CLIENT = ApiClient(
+    DefaultConfig.API_BASE_URL,
+    timeout_seconds=DefaultConfig.API_TIMEOUT_SECONDS,
+    max_connections=DefaultConfig.API_MAX_CONNECTIONS,
+    max_concurrency=DefaultConfig.API_MAX_CONCURRENCY
+)
+
+PROFILE_CACHE = ProfileCache(
+    ttl_seconds=DefaultConfig.PROFILE_CACHE_TTL_SECONDS,
+    negative_ttl_seconds=DefaultConfig.PROFILE_CACHE_NEGATIVE_TTL_SECONDS,
+    max_entries=DefaultConfig.PROFILE_CACHE_MAX_ENTRIES
+)
+
+# Writes are acknowledged straight away and POSTed in the background, with
+# allergies and preferences coalesced into bulk requests. The recipes that
+# preferences refer to are stored while the preferences are flushed.
+WRITE_QUEUE = WriteBehindQueue(
+    CLIENT,
+    bulk_paths=["allergies", "preferences"],
+    single_paths=["users"],
+    max_batch_size=DefaultConfig.WRITE_BEHIND_MAX_BATCH_SIZE,
+    flush_interval_seconds=DefaultConfig.WRITE_BEHIND_FLUSH_SECONDS,
+    max_retries=DefaultConfig.WRITE_BEHIND_MAX_RETRIES,
+    preparers={"preferences": lambda rows: _store_recipes(rows)}
+)
+
+# Hashes of recipes the API is known to store, so their text isn't uploaded again
+STORED_RECIPES = ProfileCache(
+    ttl_seconds=DefaultConfig.STORED_RECIPES_TTL_SECONDS,
+    max_entries=DefaultConfig.STORED_RECIPES_MAX_ENTRIES
+)
+
+def _query_batches(name: str, values: List[str], max_items: int = None):
+    """
+    Splits values into batches that are each sent as one name=<JSON list> query
+    string no longer than API_MAX_QUERY_LENGTH (and of at most max_items values). A
+    value too long to fit with any other is sent on its own.
+    """
+    max_length = DefaultConfig.API_MAX_QUERY_LENGTH
+    empty_length = len(urllib.parse.urlencode({name: json.dumps([])}))
+    separator_length = len(urllib.parse.quote_plus(", "))
 
-    return user
+    batch, length = [], empty_length
+    for value in values:
+        value_length = len(urllib.parse.quote_plus(json.dumps(value)))
+        added_length = value_length + (separator_length if batch else 0)
+        if batch and (length + added_length > max_length or len(batch) == max_items):
+            yield batch
+            batch, length = [], empty_length
+            added_length = value_length
+        batch.append(value)
+        length += added_length
+    if batch:
+        yield batch
 
-def add_or_update_user(id: str, name: str):
+async def add_or_update_user(id: str, name: str):
 
-    url = DefaultConfig.API_BASE_URL + "users"
     body = {"id": id, "name": name}
-    response = requests.post(url, json=body)
-
-def get_user_allergies(userid: str):
-    
-    parsed_id = urllib.parse.quote(userid)
-    url = DefaultConfig.API_BASE_URL + "allergies/"+parsed_id
-    response = requests.get(url)
-    try:
-        allergies_response = json.loads(response.content)
-        allergies = [ row["allergy_ingredient"] for row in allergies_response ]
-    except IndexError:
-        allergies = None
-    return allergies
-
-def add_user_allergies(userid: str, allergies: List[str]):
-
-    url = DefaultConfig.API_BASE_URL + "allergies"
+    WRITE_QUEUE.enqueue("users", body)
+    # Reads before the write is flushed should already see the user
+    PROFILE_CACHE.set(("user", id), body)
+    PROFILE_CACHE.invalidate(("profile_etag", id))
+
+async def _fetch_user_profile(id: str):
+
+    # Revalidate with the last ETag we saw; a 304 means our copy is still current
+    found, validator = PROFILE_CACHE.get(("profile_etag", id))
+    headers = {"If-None-Match": validator[0]} if found else {}
+
+    parsed_id = urllib.parse.quote(id)
+    status, response_headers, body = await CLIENT.request(
+        "GET", "profiles/" + parsed_id, headers=headers
+    )
+    if status == 304 and found:
+        _, user, allergies = validator
+    elif status == 404:
+        user, allergies = None, []
+    elif 200 <= status < 300 and body is not None:
+        user = body.get("user")
+        allergies = body.get("allergies", [])
+        etag = response_headers.get("ETag")
+        if etag:
+            PROFILE_CACHE.set(
+                ("profile_etag", id),
+                (etag, user, allergies),
+                ttl_seconds=DefaultConfig.PROFILE_ETAG_TTL_SECONDS
+            )
+    else:
+        # Only a real answer may be cached; a failure must not turn a returning
+        # user into a missing one
+        raise ApiError(status, "profiles/" + parsed_id)
+
+    PROFILE_CACHE.set(("user", id), user)
+    PROFILE_CACHE.set(("allergies", id), allergies)
+    return user, allergies
+
+async def get_user_profile(id: str):
+    """
+    Returns (user, allergies) from the cache, or from a single conditional request
+    to the combined profile endpoint.
+    """
+    found, values = PROFILE_CACHE.get_many([("user", id), ("allergies", id)])
+    if found:
+        return tuple(values)
+    return await _fetch_user_profile(id)
+
+async def get_user_profiles(ids: List[str]) -> dict:
+    """
+    Returns {id: (user, allergies)}, looking up all uncached ids with one request
+    per batch of up to PROFILE_BATCH_SIZE ids (fewer when long ids would make the
+    URL too long) to the batch profile endpoint. Ids in a batch whose request
+    failed are left out, and are looked up again by get_user_profile.
+    """
+    profiles = {}
+    missing = []
+    for id in dict.fromkeys(ids):
+        found, values = PROFILE_CACHE.get_many([("user", id), ("allergies", id)])
+        if found:
+            profiles[id] = tuple(values)
+        else:
+            missing.append(id)
+
+    for batch in _query_batches("ids", missing, max_items=DefaultConfig.PROFILE_BATCH_SIZE):
+        query = urllib.parse.urlencode({"ids": json.dumps(batch)})
+        try:
+            rows = await CLIENT.get_json("profiles?" + query)
+            if not isinstance(rows, list):
+                raise ValueError("expected a list of profiles")
+        except (ApiError, aiohttp.ClientError, asyncio.TimeoutError, ValueError) as err:
+            # Leave these ids uncached rather than caching them all as new users
+            print(f"Batch profile lookup failed for {len(batch)} id(s): {err}", file=sys.stderr)
+            continue
+        fetched = {row["user"]["id"]: (row["user"], row["allergies"]) for row in rows}
+        for id in batch:
+            # Ids the API doesn't know are cached as missing users
+            user, allergies = fetched.get(id, (None, []))
+            PROFILE_CACHE.set(("user", id), user)
+            PROFILE_CACHE.set(("allergies", id), allergies)
+            profiles[id] = (user, allergies)
+
+    return profiles
+
+async def add_user_allergies(userid: str, allergies: List[str]):
+
     body = [
         { "userid": userid, "allergy_ingredient": allergy }
             for allergy in allergies
     ]
-    reponse = requests.post(url, json=body)
+    WRITE_QUEUE.enqueue("allergies", body)
+    found, cached_allergies = PROFILE_CACHE.get(("allergies", userid))
+    if found and cached_allergies is not None:
+        PROFILE_CACHE.set(("allergies", userid), cached_allergies + list(allergies))
+    else:
+        PROFILE_CACHE.invalidate(("allergies", userid))
+    PROFILE_CACHE.invalidate(("profile_etag", userid))
+
+def recipe_hash(recipe: str) -> str:
+    return hashlib.sha256(recipe.encode("utf-8")).hexdigest()
+
+async def _missing_recipes(hashes: List[str]) -> List[str]:
+    """
+    Returns the hashes the API doesn't store yet, asking only about ones not
+    already known to be stored.
+    """
+    unknown = [h for h in dict.fromkeys(hashes) if not STORED_RECIPES.get(h)[0]]
+
+    missing = []
+    for batch in _query_batches("hashes", unknown):
+        query = urllib.parse.urlencode({"hashes": json.dumps(batch)})
+        try:
+            found = await CLIENT.get_json("recipes/missing?" + query)
+        except (ApiError, aiohttp.ClientError, asyncio.TimeoutError, ValueError) as err:
+            found = None
+            print(f"Could not check stored recipes: {err}", file=sys.stderr)
+        if not isinstance(found, list):
+            # Upload them all; storing a recipe twice is harmless
+            missing.extend(batch)
+            continue
+
+        found = set(found)
+        for h in batch:
+            if h in found:
+                missing.append(h)
+            else:
+                STORED_RECIPES.set(h, True)
+    return missing
+
+async def _store_recipes(rows: List[dict]) -> List[dict]:
+    """
+    Runs in the write-behind flush, before preference rows are posted. Uploads the
+    recipes the API doesn't have yet and replaces each row's recipe text with its
+    hash. Rows whose recipe couldn't be stored are left out, as their hash would
+    refer to nothing.
+    """
+    hashes = [recipe_hash(row["recipe"]) for row in rows]
+    recipes = dict(zip(hashes, (row["recipe"] for row in rows)))
+    missing = await _missing_recipes(list(recipes))
+
+    stored = set(recipes)
+    batch_size = WRITE_QUEUE.max_batch_size
+    for start in range(0, len(missing), batch_size):
+        chunk = missing[start:start + batch_size]
+        body = [{"hash": h, "recipe": recipes[h]} for h in chunk]
+        if await WRITE_QUEUE.post("recipes", body, len(chunk)):
+            for h in chunk:
+                STORED_RECIPES.set(h, True)
+        else:
+            stored.difference_update(chunk)
+
+    return [
+        {
+            "userId": row["userId"],
+            "recipe_hash": h,
+            "marked_as_preference": row["marked_as_preference"]
+        }
+        for h, row in zip(hashes, rows) if h in stored
+    ]
 
-def add_user_preferences(userid: str, preferences: List[dict]):
+async def add_user_preferences(userid: str, preferences: List[dict]):
 
-    url = DefaultConfig.API_BASE_URL + "preferences"
+    # Preferences refer to recipes by the hash of their text; the recipes are
+    # uploaded, when the API doesn't have them yet, as the preferences are flushed
     body = [
-        { 
+        {
             "userId": userid,
-            "recipe": preference["recipe"] ,
+            "recipe": preference["recipe"],
             "marked_as_preference": preference["marked_as_preference"]
         }
         for preference in preferences
     ]
-    reponse = requests.post(url, json=body)
\ No newline at end of file
+    WRITE_QUEUE.enqueue("preferences", body)
+
+async def close():
+    # Flush buffered writes before the connection pool goes away
+    await WRITE_QUEUE.close()
+    await CLIENT.close()
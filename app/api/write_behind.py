@@ -0,0 +1,150 @@
+import asyncio
+import sys
+
+import aiohttp
+
+from typing import Awaitable, Callable, Dict, List
+
+from .client import ApiClient
+
+class WriteBehindQueue:
+    """
+    Buffers writes to the Functions API so the user's turn doesn't wait on them.
+    Rows for endpoints that accept lists are coalesced into bulk POSTs, flushed when
+    max_batch_size rows are waiting or every flush_interval_seconds. Failed POSTs are
+    retried with exponential backoff.
+
+    A path can have a preparer, a coroutine function run on its rows during the flush
+    just before they are posted; rows it leaves out are counted as dropped.
+    """
+
+    def __init__(
+        self,
+        client: ApiClient,
+        bulk_paths: List[str],
+        single_paths: List[str],
+        max_batch_size: int = 100,
+        flush_interval_seconds: float = 2.0,
+        max_retries: int = 5,
+        backoff_seconds: float = 0.5,
+        preparers: Dict[str, Callable[[list], Awaitable[list]]] = None
+    ):
+        self._client = client
+        self.bulk_paths = list(bulk_paths)
+        # Endpoints taking one object per request are flushed first, so rows that
+        # refer to them (e.g. a new user's allergies) are written after them
+        self.single_paths = list(single_paths)
+        self.max_batch_size = max_batch_size
+        self.flush_interval_seconds = flush_interval_seconds
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.preparers = dict(preparers or {})
+
+        self._pending = {path: [] for path in self.single_paths + self.bulk_paths}
+        self._flush_event = None
+        self._worker = None
+        self._flush_lock = None
+        self._closing = False
+
+        self.enqueued_rows = 0
+        self.written_rows = 0
+        self.posts = 0
+        self.retries = 0
+        self.dropped_rows = 0
+
+    @property
+    def pending_rows(self) -> int:
+        return sum(len(rows) for rows in self._pending.values())
+
+    def _ensure_started(self):
+        if self._worker is None or self._worker.done():
+            self._flush_event = asyncio.Event()
+            self._flush_lock = asyncio.Lock()
+            self._worker = asyncio.ensure_future(self._run())
+
+    def enqueue(self, path: str, rows):
+        rows = rows if isinstance(rows, list) else [rows]
+        self._ensure_started()
+        self._pending[path].extend(rows)
+        self.enqueued_rows += len(rows)
+        if len(self._pending[path]) >= self.max_batch_size:
+            self._flush_event.set()
+
+    async def _run(self):
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._flush_event.wait(), self.flush_interval_seconds)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_event.clear()
+            await self.flush()
+
+    async def flush(self):
+        if self._flush_lock is None:
+            return
+        async with self._flush_lock:
+            for path in self.single_paths:
+                rows = await self._take(path)
+                for row in rows:
+                    await self.post(path, row, 1)
+            for path in self.bulk_paths:
+                rows = await self._take(path)
+                for start in range(0, len(rows), self.max_batch_size):
+                    chunk = rows[start:start + self.max_batch_size]
+                    await self.post(path, chunk, len(chunk))
+
+    async def _take(self, path: str) -> list:
+        rows, self._pending[path] = self._pending[path], []
+        if not rows or path not in self.preparers:
+            return rows
+        try:
+            prepared = await self.preparers[path](rows)
+        except Exception as err:
+            prepared = []
+            print(f"Could not prepare {len(rows)} row(s) for {path}: {err}", file=sys.stderr)
+        self.dropped_rows += len(rows) - len(prepared)
+        return prepared
+
+    async def post(self, path: str, body, row_count: int) -> bool:
+        """
+        POSTs straight away, retrying like buffered writes. Returns whether the API
+        accepted the rows.
+        """
+        for attempt in range(self.max_retries + 1):
+            try:
+                self.posts += 1
+                status, _, _ = await self._client.request("POST", path, json=body)
+                if 200 <= status < 300:
+                    self.written_rows += row_count
+                    return True
+                error = f"HTTP {status}"
+                if status < 500:
+                    # The API rejected the rows; retrying won't help
+                    break
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as err:
+                error = err
+            if attempt < self.max_retries:
+                self.retries += 1
+                await asyncio.sleep(self.backoff_seconds * 2 ** attempt)
+        self.dropped_rows += row_count
+        print(f"Dropped {row_count} row(s) for {path}: {error}", file=sys.stderr)
+        return False
+
+    async def close(self):
+        # Let the background worker finish its current flush, then write out
+        # everything still buffered
+        self._closing = True
+        if self._worker is not None:
+            self._flush_event.set()
+            await self._worker
+        await self.flush()
+
+    def stats(self) -> dict:
+        return {
+            "pending_rows": self.pending_rows,
+            "enqueued_rows": self.enqueued_rows,
+            "written_rows": self.written_rows,
+            "posts": self.posts,
+            "retries": self.retries,
+            "dropped_rows": self.dropped_rows,
+        }
@@ -1,3 +1,4 @@
+import asyncio
 import sys
 import traceback
 from datetime import datetime
@@ -16,6 +17,18 @@ from botbuilder.core import (
 from botbuilder.core.integration import aiohttp_error_middleware
 from botbuilder.schema import Activity, ActivityTypes
 
+from ai import (
+    InferenceExecutor,
+    ModelRegistry,
+    RecipeCache,
+    MemoryCacheBackend,
+    DiskCacheBackend,
+    TEXT_ANALYTICS,
+    IMAGE_ANALYTICS,
+    INGREDIENT_LEXICON,
+    enable_compilation_cache
+)
+from api import request_handler
 from bots import RecipeBot
 from config import DefaultConfig
 
@@ -62,8 +75,36 @@ MEMORY = MemoryStorage()
 USER_STATE = UserState(MEMORY)
 CONVERSATION_STATE = ConversationState(MEMORY)
 
+# Reuse compiled XLA executables across restarts and replicas
+enable_compilation_cache(CONFIG.JAX_COMPILATION_CACHE_DIR)
+
+# Cache generated recipes per ingredient prompt
+if CONFIG.RECIPE_CACHE_BACKEND == "none":
+    RECIPE_CACHE = None
+else:
+    RECIPE_CACHE = RecipeCache(
+        backend=(
+            DiskCacheBackend(CONFIG.RECIPE_CACHE_PATH)
+            if CONFIG.RECIPE_CACHE_BACKEND == "disk"
+            else MemoryCacheBackend()
+        ),
+        max_entries=CONFIG.RECIPE_CACHE_MAX_ENTRIES,
+        ttl_seconds=CONFIG.RECIPE_CACHE_TTL_SECONDS,
+        pool_size=CONFIG.RECIPE_CACHE_POOL_SIZE
+    )
+
+# Create the process-wide model registry, shared by every dialog and conversation
+MODEL_REGISTRY = ModelRegistry(
+    executor=InferenceExecutor(CONFIG.INFERENCE_WORKERS, CONFIG.INFERENCE_QUEUE_DEPTH),
+    max_batch_size=CONFIG.MAX_BATCH_SIZE,
+    batch_window_ms=CONFIG.BATCH_WINDOW_MS,
+    recipe_cache=RECIPE_CACHE,
+    num_candidates=CONFIG.RECIPE_CANDIDATES,
+    num_results=CONFIG.RECIPE_RESULTS
+)
+
 # Create the Bot
-BOT = RecipeBot(CONVERSATION_STATE, USER_STATE)
+BOT = RecipeBot(CONVERSATION_STATE, USER_STATE, MODEL_REGISTRY)
 
 # Listen for incoming requests on /api/messages.
 async def messages(req: Request) -> Response:
@@ -82,8 +123,63 @@ async def messages(req: Request) -> Response:
     return Response(status=HTTPStatus.OK)
 
 
+# Report model, executor and cache metrics on /api/metrics.
+async def metrics(req: Request) -> Response:
+    return json_response(data={
+        "model_registry": MODEL_REGISTRY.stats(),
+        "profile_cache": request_handler.PROFILE_CACHE.stats(),
+        "write_queue": request_handler.WRITE_QUEUE.stats(),
+        "text_analytics": TEXT_ANALYTICS.stats(),
+        "image_analytics": IMAGE_ANALYTICS.stats(),
+        "ingredient_lexicon": INGREDIENT_LEXICON.stats(),
+    })
+
+
+# Report ready on /api/ready only once the recipe model has been loaded and warmed up.
+async def ready(req: Request) -> Response:
+    if MODEL_REGISTRY.is_ready or not CONFIG.PRELOAD_RECIPE_MODEL:
+        return json_response(data={"ready": True}, status=HTTPStatus.OK)
+    return json_response(data={"ready": False}, status=HTTPStatus.SERVICE_UNAVAILABLE)
+
+
+async def warm_up_models():
+    try:
+        await MODEL_REGISTRY.executor.run(
+            MODEL_REGISTRY.warm_up, CONFIG.WARMUP_BATCH_SIZES, CONFIG.STREAM_RECIPES
+        )
+    except Exception as error:
+        print(f"\n [warm_up] recipe model warm-up failed: {error}", file=sys.stderr)
+        traceback.print_exc()
+
+
+async def on_startup(app: web.Application):
+    if CONFIG.PROFILE_PREWARM_IDS:
+        try:
+            await request_handler.get_user_profiles(CONFIG.PROFILE_PREWARM_IDS)
+        except Exception as error:
+            print(f"\n [on_startup] profile cache pre-warm failed: {error}", file=sys.stderr)
+
+    # Load and compile the recipe model in the background so the first user doesn't
+    # pay for it; /api/ready reports when it has finished
+    if CONFIG.PRELOAD_RECIPE_MODEL:
+        app["warm_up"] = asyncio.ensure_future(warm_up_models())
+
+
+async def on_cleanup(app: web.Application):
+    if "warm_up" in app:
+        app["warm_up"].cancel()
+    MODEL_REGISTRY.executor.shutdown()
+    await request_handler.close()
+    await TEXT_ANALYTICS.close()
+    await IMAGE_ANALYTICS.close()
+
+
 APP = web.Application(middlewares=[aiohttp_error_middleware])
 APP.router.add_post("/api/messages", messages)
+APP.router.add_get("/api/ready", ready)
+APP.router.add_get("/api/metrics", metrics)
+APP.on_startup.append(on_startup)
+APP.on_cleanup.append(on_cleanup)
 
 if __name__ == "__main__":
     try:
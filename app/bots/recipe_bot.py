@@ -8,15 +8,21 @@ from botbuilder.schema import (
     ChannelAccount
 )
 
+from ai import ModelRegistry
 from data_models import ConversationData, UserProfile
-from api.request_handler import get_user, get_user_allergies
+from api.request_handler import get_user_profile, get_user_profiles
 from dialogs import WelcomeNewUserDialog, ProvideIngredientsDialog
 from helpers import DialogHelper
 
 from typing import List
 
 class RecipeBot(ActivityHandler):
-    def __init__(self, conversation_state: ConversationState, user_state: UserState):
+    def __init__(
+        self,
+        conversation_state: ConversationState,
+        user_state: UserState,
+        model_registry: ModelRegistry
+    ):
         if conversation_state is None:
             raise TypeError(
                 "[RecipeBot]: Missing parameter. conversation_state is required but None was given"
@@ -25,9 +31,14 @@ class RecipeBot(ActivityHandler):
             raise TypeError(
                 "[RecipeBot]: Missing parameter. user_state is required but None was given"
             )
+        if model_registry is None:
+            raise TypeError(
+                "[RecipeBot]: Missing parameter. model_registry is required but None was given"
+            )
 
         self._conversation_state = conversation_state
         self._user_state = user_state
+        self._model_registry = model_registry
 
         self.conversation_data_accessor = self._conversation_state.create_property(
             "ConversationData"
@@ -61,14 +72,23 @@ class RecipeBot(ActivityHandler):
             turn_context, ConversationData
         )
 
+        # Look up all joining members in one request; the loop below then reads
+        # their profiles from the cache
+        member_ids = [
+            member.id for member in members_added
+                if member.id != turn_context.activity.recipient.id
+        ]
+        if len(member_ids) > 1:
+            await get_user_profiles(member_ids)
+
         for member in members_added:
             if member.id != turn_context.activity.recipient.id:
                 await turn_context.send_activity(
                     f"Hi there { member.name }. " + self.WELCOME_MESSAGE
                 )
                 
-                # Get user from database
-                user = get_user(member.id)
+                # Get user and their allergies from the database (or profile cache)
+                user, allergies = await get_user_profile(member.id)
                 if not user:
                     user_profile.id = member.id
                     user_profile.name = member.name
@@ -78,7 +98,6 @@ class RecipeBot(ActivityHandler):
                         self._conversation_state.create_property("WelcomeNewUserDialogState")
                     )
                 else:
-                    allergies = get_user_allergies(user.get("id"))
                     user_profile.id = user.get("id")
                     user_profile.name = user.get("name")
                     user_profile.allergies = allergies
@@ -93,7 +112,7 @@ class RecipeBot(ActivityHandler):
                             allergies_msg = allergies[0]
                         await turn_context.send_activity(f"You previously said you were allergic to: {allergies_msg}")
                     await DialogHelper.run_dialog(
-                        ProvideIngredientsDialog(self._user_state, self._conversation_state),
+                        ProvideIngredientsDialog(self._user_state, self._conversation_state, self._model_registry),
                         turn_context,
                         self._conversation_state.create_property("ProvideIngredientsDialog")
                     )
@@ -109,7 +128,7 @@ class RecipeBot(ActivityHandler):
         )
         if conversation_data.did_welcome:
             await DialogHelper.run_dialog(
-                ProvideIngredientsDialog(self._user_state, self._conversation_state),
+                ProvideIngredientsDialog(self._user_state, self._conversation_state, self._model_registry),
                     turn_context,
                     self._conversation_state.create_property("ProvideIngredientsDialog")
                 )
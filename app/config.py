@@ -11,4 +11,95 @@ class DefaultConfig:
     APP_PASSWORD = os.environ.get("MicrosoftAppPassword", "")
     API_BASE_URL = os.environ.get("API_BASE_URL","")
     COGNITIVE_SERVICES_KEY = os.environ.get("COGNITIVE_SERVICES_KEY","")
-    COGNITIVE_SERVICES_ENDPOINT = os.environ.get("COGNITIVE_SERVICES_ENDPOINT","")
\ No newline at end of file
+    COGNITIVE_SERVICES_ENDPOINT = os.environ.get("COGNITIVE_SERVICES_ENDPOINT","")
+    PRELOAD_RECIPE_MODEL = os.environ.get("PRELOAD_RECIPE_MODEL", "true").lower() == "true"
+    INFERENCE_WORKERS = int(os.environ.get("INFERENCE_WORKERS", "1"))
+    INFERENCE_QUEUE_DEPTH = int(os.environ.get("INFERENCE_QUEUE_DEPTH", "16"))
+    MAX_BATCH_SIZE = int(os.environ.get("MAX_BATCH_SIZE", "8"))
+    BATCH_WINDOW_MS = float(os.environ.get("BATCH_WINDOW_MS", "20"))
+    # Batch sizes compiled at startup; by default every one up to MAX_BATCH_SIZE
+    WARMUP_BATCH_SIZES = [
+        int(size) for size in os.environ.get("WARMUP_BATCH_SIZES", "").split(",") if size
+    ]
+    JAX_COMPILATION_CACHE_DIR = os.environ.get(
+        "JAX_COMPILATION_CACHE_DIR", os.path.join(os.path.dirname(__file__), ".jax_cache")
+    )
+    # One of "memory", "disk" or "none"
+    RECIPE_CACHE_BACKEND = os.environ.get("RECIPE_CACHE_BACKEND", "memory").lower()
+    RECIPE_CACHE_PATH = os.environ.get(
+        "RECIPE_CACHE_PATH", os.path.join(os.path.dirname(__file__), "recipe_cache.sqlite3")
+    )
+    RECIPE_CACHE_MAX_ENTRIES = int(os.environ.get("RECIPE_CACHE_MAX_ENTRIES", "1024"))
+    RECIPE_CACHE_TTL_SECONDS = float(os.environ.get("RECIPE_CACHE_TTL_SECONDS", "86400"))
+    RECIPE_CACHE_POOL_SIZE = int(os.environ.get("RECIPE_CACHE_POOL_SIZE", "3"))
+    # Recipes sampled per input in one batched decode, and how many of the best are shown
+    RECIPE_CANDIDATES = int(os.environ.get("RECIPE_CANDIDATES", "3"))
+    RECIPE_RESULTS = int(os.environ.get("RECIPE_RESULTS", "1"))
+    # Send each recipe's title and ingredients as soon as they're decoded. Streamed
+    # recipes are batched and cached like the rest, but only the best candidate of each
+    # input is shown (RECIPE_RESULTS is ignored), picked once its ingredients are known.
+    STREAM_RECIPES = os.environ.get("STREAM_RECIPES", "true").lower() == "true"
+    API_TIMEOUT_SECONDS = float(os.environ.get("API_TIMEOUT_SECONDS", "10"))
+    API_MAX_CONNECTIONS = int(os.environ.get("API_MAX_CONNECTIONS", "20"))
+    API_MAX_CONCURRENCY = int(os.environ.get("API_MAX_CONCURRENCY", "20"))
+    # Lists sent in a query string are split so each URL stays well under the
+    # Functions host's 4 KB limit
+    API_MAX_QUERY_LENGTH = int(os.environ.get("API_MAX_QUERY_LENGTH", "2048"))
+    PROFILE_CACHE_TTL_SECONDS = float(os.environ.get("PROFILE_CACHE_TTL_SECONDS", "300"))
+    PROFILE_CACHE_NEGATIVE_TTL_SECONDS = float(os.environ.get("PROFILE_CACHE_NEGATIVE_TTL_SECONDS", "30"))
+    # How long ETags from the combined profile endpoint are kept for conditional GETs
+    PROFILE_ETAG_TTL_SECONDS = float(os.environ.get("PROFILE_ETAG_TTL_SECONDS", "86400"))
+    PROFILE_CACHE_MAX_ENTRIES = int(os.environ.get("PROFILE_CACHE_MAX_ENTRIES", "10000"))
+    PROFILE_BATCH_SIZE = int(os.environ.get("PROFILE_BATCH_SIZE", "50"))
+    # Comma separated user ids whose profiles are loaded into the cache at startup
+    PROFILE_PREWARM_IDS = [
+        id for id in os.environ.get("PROFILE_PREWARM_IDS", "").split(",") if id
+    ]
+    WRITE_BEHIND_MAX_BATCH_SIZE = int(os.environ.get("WRITE_BEHIND_MAX_BATCH_SIZE", "100"))
+    WRITE_BEHIND_FLUSH_SECONDS = float(os.environ.get("WRITE_BEHIND_FLUSH_SECONDS", "2"))
+    WRITE_BEHIND_MAX_RETRIES = int(os.environ.get("WRITE_BEHIND_MAX_RETRIES", "5"))
+    # Recipe hashes known to be stored by the API, whose text is not uploaded again
+    STORED_RECIPES_TTL_SECONDS = float(os.environ.get("STORED_RECIPES_TTL_SECONDS", "86400"))
+    STORED_RECIPES_MAX_ENTRIES = int(os.environ.get("STORED_RECIPES_MAX_ENTRIES", "10000"))
+    # Normalized texts whose key phrases are kept in memory
+    KEY_PHRASE_CACHE_MAX_ENTRIES = int(os.environ.get("KEY_PHRASE_CACHE_MAX_ENTRIES", "10000"))
+    # Key phrase requests from concurrent conversations are sent together, up to the
+    # service's per-request document limit
+    KEY_PHRASE_MAX_BATCH_SIZE = int(os.environ.get("KEY_PHRASE_MAX_BATCH_SIZE", "10"))
+    KEY_PHRASE_BATCH_WINDOW_MS = float(os.environ.get("KEY_PHRASE_BATCH_WINDOW_MS", "10"))
+    # Larger attachments are skipped without being decoded
+    IMAGE_MAX_BYTES = int(os.environ.get("IMAGE_MAX_BYTES", str(20 * 1024 * 1024)))
+    IMAGE_FETCH_MAX_CONNECTIONS = int(os.environ.get("IMAGE_FETCH_MAX_CONNECTIONS", "10"))
+    IMAGE_FETCH_TIMEOUT_SECONDS = float(os.environ.get("IMAGE_FETCH_TIMEOUT_SECONDS", "30"))
+    IMAGE_ANALYSIS_WORKERS = int(os.environ.get("IMAGE_ANALYSIS_WORKERS", "4"))
+    # Photos are downscaled to about the detector's training resolution (416px) and
+    # re-encoded as JPEG before upload
+    IMAGE_MAX_DIMENSION = int(os.environ.get("IMAGE_MAX_DIMENSION", "512"))
+    IMAGE_JPEG_QUALITY = int(os.environ.get("IMAGE_JPEG_QUALITY", "85"))
+    # Detections are reused for photos within IMAGE_CACHE_MAX_DISTANCE bits of a cached
+    # photo's 64 bit perceptual hash; 0 entries disables the cache
+    IMAGE_CACHE_TTL_SECONDS = float(os.environ.get("IMAGE_CACHE_TTL_SECONDS", "3600"))
+    IMAGE_CACHE_MAX_DISTANCE = int(os.environ.get("IMAGE_CACHE_MAX_DISTANCE", "6"))
+    IMAGE_CACHE_MAX_ENTRIES = int(os.environ.get("IMAGE_CACHE_MAX_ENTRIES", "1000"))
+    # "remote" calls the Custom Vision prediction API, "local" runs its ONNX export in-process
+    IMAGE_ANALYTICS_BACKEND = os.environ.get("IMAGE_ANALYTICS_BACKEND", "remote")
+    LOCAL_IMAGE_MODEL_PATH = os.environ.get(
+        "LOCAL_IMAGE_MODEL_PATH", os.path.join(os.path.dirname(__file__), "models", "ingredient_detector", "model.onnx")
+    )
+    LOCAL_IMAGE_LABELS_PATH = os.environ.get(
+        "LOCAL_IMAGE_LABELS_PATH", os.path.join(os.path.dirname(__file__), "models", "ingredient_detector", "labels.txt")
+    )
+    # Names of the export's class id and probability outputs
+    LOCAL_IMAGE_CLASSES_OUTPUT = os.environ.get("LOCAL_IMAGE_CLASSES_OUTPUT", "detected_classes")
+    LOCAL_IMAGE_SCORES_OUTPUT = os.environ.get("LOCAL_IMAGE_SCORES_OUTPUT", "detected_scores")
+    LOCAL_IMAGE_MAX_BATCH_SIZE = int(os.environ.get("LOCAL_IMAGE_MAX_BATCH_SIZE", "8"))
+    LOCAL_IMAGE_BATCH_WINDOW_MS = float(os.environ.get("LOCAL_IMAGE_BATCH_WINDOW_MS", "5"))
+    LOCAL_IMAGE_QUEUE_DEPTH = int(os.environ.get("LOCAL_IMAGE_QUEUE_DEPTH", "16"))
+    # 0 lets onnxruntime use every core
+    LOCAL_IMAGE_THREADS = int(os.environ.get("LOCAL_IMAGE_THREADS", "0"))
+    # Text ingredients are extracted locally when at least this share of the words are
+    # known ingredients (ignoring separators and quantities), otherwise by Text Analytics
+    INGREDIENT_VOCABULARY_PATH = os.environ.get(
+        "INGREDIENT_VOCABULARY_PATH", os.path.join(os.path.dirname(__file__), "ai", "ingredient_vocabulary.txt")
+    )
+    INGREDIENT_LEXICON_MIN_COVERAGE = float(os.environ.get("INGREDIENT_LEXICON_MIN_COVERAGE", "1.0"))
\ No newline at end of file
@@ -8,7 +8,7 @@ from botbuilder.dialogs import (
 from botbuilder.dialogs.prompts import TextPrompt, ConfirmPrompt, PromptOptions
 from botbuilder.core import MessageFactory
 
-from ai import TextAnalytics
+from ai import TEXT_ANALYTICS
 
 class AllergiesDialog(ComponentDialog):
     def __init__(self, dialog_id: str = None):
@@ -35,8 +35,7 @@ class AllergiesDialog(ComponentDialog):
     async def confirm_step(self, step_context: WaterfallStepContext) -> DialogTurnResult:
         
         raw_allergies = step_context.result
-        text_analytics = TextAnalytics()
-        allergies = text_analytics.key_phrase_extraction([raw_allergies])
+        allergies = await TEXT_ANALYTICS.key_phrase_extraction(raw_allergies)
         # Extract allergies from the text
         step_context.values["allergies"] = allergies
         if len(allergies)>1:
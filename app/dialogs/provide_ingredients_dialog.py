@@ -11,18 +11,27 @@ from botbuilder.dialogs.prompts import (
     PromptValidatorContext
 )
 from botbuilder.core import MessageFactory, UserState, ConversationState
+from botbuilder.schema import Activity, ActivityTypes
 
+from config import DefaultConfig
 from dialogs import ChooseRecipeDialog
 from data_models import UserProfile
-from ai import TextAnalytics, ImageAnalytics, RecipeGenerator
+from ai import TEXT_ANALYTICS, IMAGE_ANALYTICS, INGREDIENT_LEXICON, ModelRegistry, InferenceQueueFullError
 
 from api.request_handler import add_user_preferences
 
 class ProvideIngredientsDialog(ComponentDialog):
     
-    def __init__(self, user_state: UserState, conversation_state: ConversationState):
+    def __init__(
+            self,
+            user_state: UserState,
+            conversation_state: ConversationState,
+            model_registry: ModelRegistry
+    ):
         super(ProvideIngredientsDialog, self).__init__(ProvideIngredientsDialog.__name__)
 
+        self.model_registry = model_registry
+
         self.user_profile_accessor = user_state.create_property("UserProfile")
         self.conversation_data_accessor = conversation_state.create_property("ConversationData")
 
@@ -74,12 +83,13 @@ class ProvideIngredientsDialog(ComponentDialog):
         # If the return type is a string:
         if isinstance(step_context.result,str):
             raw_ingredients = step_context.result
-            text_analytics = TextAnalytics()
-            ingredients = text_analytics.key_phrase_extraction([raw_ingredients])
+            # Plain lists of known ingredients don't need the remote service
+            ingredients = INGREDIENT_LEXICON.extract(raw_ingredients)
+            if ingredients is None:
+                ingredients = await TEXT_ANALYTICS.key_phrase_extraction(raw_ingredients)
         else:
             attachments = step_context.result
-            image_analytics = ImageAnalytics()
-            ingredients = image_analytics.detect_objects_in_attachments(attachments)
+            ingredients = await IMAGE_ANALYTICS.detect_objects_in_attachments(attachments)
 
         if ingredients is None:
             await step_context.context.send_activity(
@@ -150,49 +160,123 @@ class ProvideIngredientsDialog(ComponentDialog):
             )
 
     async def recipe_generation_step(self, step_context: WaterfallStepContext) -> DialogTurnResult:
-        recipe_generator = RecipeGenerator()
-        generated_recipes = recipe_generator.generation_function(step_context.values["ingredients"])
-        
         user_profile = await self.user_profile_accessor.get(
             step_context.context, UserProfile
         )
-        # Filter allergies out of recipes
-        if user_profile.allergies:
-            generated_recipes = [ 
-                text for text in generated_recipes
-                    if not any(allergy in text for allergy in user_profile.allergies)
-                ]
+        # Let the user know we're working on it while the recipes are decoded
+        await step_context.context.send_activity(Activity(type=ActivityTypes.typing))
+        try:
+            if DefaultConfig.STREAM_RECIPES:
+                generated_recipes = await self.stream_recipes(
+                    step_context, step_context.values["ingredients"], user_profile.allergies
+                )
+            else:
+                # The user's allergens are banned while decoding so recipes never contain them
+                generated_recipes = await self.model_registry.generate_recipes(
+                    step_context.values["ingredients"],
+                    allergies=user_profile.allergies
+                )
+        except InferenceQueueFullError:
+            await step_context.context.send_activity(
+                    "I'm cooking up a lot of recipes right now, may you please try again in a moment?"
+                )
+            return await step_context.replace_dialog(
+                ProvideIngredientsDialog.__name__
+            )
+
+        if not DefaultConfig.STREAM_RECIPES:
+            # Safety net for spellings the decoding constraint doesn't cover
+            if user_profile.allergies:
+                generated_recipes = [ 
+                    text for text in generated_recipes
+                        if not ProvideIngredientsDialog.mentions_allergy(text, user_profile.allergies)
+                    ]
+
+            for text in generated_recipes:
+                await step_context.context.send_activity(
+                    MessageFactory.text(ProvideIngredientsDialog.format_recipe(text))
+                )
 
         step_context.values["recipes"] = generated_recipes
 
-        for text in generated_recipes:
-            section_msg = ""
-            sections = text.split("\n")
-            for section in sections:
-                section = section.strip()
-                if section.startswith("title:"):
-                    section = section.replace("title:", "")
-                    headline = "TITLE"
-                elif section.startswith("ingredients:"):
-                    section = section.replace("ingredients:", "")
-                    headline = "INGREDIENTS"
-                elif section.startswith("directions:"):
-                    section = section.replace("directions:", "")
-                    headline = "DIRECTIONS"
-                
-                if headline == "TITLE":
-                    section_msg += f"[{headline}]: {section.strip().capitalize()}\n\n"
-                else:
-                    section_info = [f"  - {i+1}: {info.strip().capitalize()}" for i, info in enumerate(section.split("--"))]
-                    section_msg += f"[{headline}]\n\n"
-                    section_msg += "\n\n".join(section_info)+"\n\n"
-            await step_context.context.send_activity(
-                MessageFactory.text(section_msg)
-            )
         if user_profile.allow_tracking:
             return await step_context.begin_dialog(ChooseRecipeDialog.__name__, {"selected": [], "recipes": generated_recipes})
         else:
             return await step_context.next(None)
+
+    async def stream_recipes(self, step_context: WaterfallStepContext, ingredients, allergies):
+        # Every ingredient's recipe is decoded in the same batch. They're sent in order,
+        # each one's title and ingredients as soon as they're decoded, then its directions.
+        # The decoding constraint can miss some spellings, so every part is checked for
+        # the user's allergens before it is sent and a recipe that mentions one is dropped.
+        sections = [[] for _ in ingredients]
+        sent = [0 for _ in ingredients]
+        dropped = set()
+
+        async def send(idx):
+            if idx in dropped:
+                return
+            if allergies and ProvideIngredientsDialog.mentions_allergy("\n".join(sections[idx]), allergies):
+                dropped.add(idx)
+                if sent[idx]:
+                    await step_context.context.send_activity(
+                        "I've left out the rest of that recipe because it mentions something you're allergic to."
+                    )
+                return
+            if len(sections[idx]) > sent[idx]:
+                await step_context.context.send_activity(
+                    MessageFactory.text(
+                        ProvideIngredientsDialog.format_recipe("\n".join(sections[idx][sent[idx]:]))
+                    )
+                )
+                sent[idx] = len(sections[idx])
+
+        current = 0
+        async for idx, section in self.model_registry.stream_recipes(ingredients, allergies):
+            sections[idx].append(section)
+            while current < len(ingredients):
+                recipe = sections[current]
+                if any(part.startswith("directions:") for part in recipe):
+                    # The directions are the last section
+                    await send(current)
+                    current += 1
+                else:
+                    if sent[current] == 0 and any(part.startswith("ingredients:") for part in recipe):
+                        await send(current)
+                        await step_context.context.send_activity(Activity(type=ActivityTypes.typing))
+                    break
+        for idx in range(current, len(ingredients)):
+            await send(idx)
+        return ["\n".join(recipe) for idx, recipe in enumerate(sections) if idx not in dropped]
+
+    @staticmethod
+    def mentions_allergy(text: str, allergies) -> bool:
+        lowered = text.lower()
+        return any(allergy.lower() in lowered for allergy in allergies)
+
+    @staticmethod
+    def format_recipe(text: str) -> str:
+        section_msg = ""
+        sections = text.split("\n")
+        for section in sections:
+            section = section.strip()
+            if section.startswith("title:"):
+                section = section.replace("title:", "")
+                headline = "TITLE"
+            elif section.startswith("ingredients:"):
+                section = section.replace("ingredients:", "")
+                headline = "INGREDIENTS"
+            elif section.startswith("directions:"):
+                section = section.replace("directions:", "")
+                headline = "DIRECTIONS"
+            
+            if headline == "TITLE":
+                section_msg += f"[{headline}]: {section.strip().capitalize()}\n\n"
+            else:
+                section_info = [f"  - {i+1}: {info.strip().capitalize()}" for i, info in enumerate(section.split("--"))]
+                section_msg += f"[{headline}]\n\n"
+                section_msg += "\n\n".join(section_info)+"\n\n"
+        return section_msg
     
     async def start_over_step(self, step_context: WaterfallStepContext) -> DialogTurnResult:
         # If the user had selected preferences because they allowed tracking, add to the database
@@ -204,7 +288,7 @@ class ProvideIngredientsDialog(ComponentDialog):
                 {"recipe" : recipe, "marked_as_preference": (idx in step_context.result)}
                     for idx, recipe in enumerate(step_context.values["recipes"])
                 ]
-            add_user_preferences(user_profile.id, preferences)
+            await add_user_preferences(user_profile.id, preferences)
 
         msg = "Thank you for participating. Would you like to try some more ingredients?"
         return await step_context.prompt(
@@ -69,7 +69,7 @@ class WelcomeNewUserDialog(ComponentDialog):
         )
         if step_context.result:
             user_profile.allow_tracking = True
-            add_or_update_user(user_profile.id, user_profile.name)
+            await add_or_update_user(user_profile.id, user_profile.name)
             await step_context.context.send_activity(
                     f"Okay {user_profile.name}, your preferences will be tracked for future use!"
                 )
@@ -102,7 +102,7 @@ class WelcomeNewUserDialog(ComponentDialog):
         
         user_profile.allergies = step_context.result
         if step_context.result and user_profile.allow_tracking:
-            add_user_allergies(user_profile.id, step_context.result)
+            await add_user_allergies(user_profile.id, step_context.result)
         conversation_data.did_welcome = True
         await step_context.context.send_activity(
             f"""Thank you for providing this information. Now it's time to generate some delicious recipes!
@@ -0,0 +1,99 @@
+"""
+Compares ingredient detection through the Custom Vision prediction API against the
+ONNX export of the same model running in-process, for single photos and for
+messages with several photos, and reports how often the two agree.
+
+Usage (from the repository root; the remote backend needs COGNITIVE_SERVICES_KEY and
+COGNITIVE_SERVICES_ENDPOINT, the local one the exported model and onnxruntime):
+    python benchmarks/image_backend_benchmark.py photo1.jpg photo2.jpg photo3.jpg \
+        --backends local remote --photos-per-message 3 --repeats 5
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "app"))
+
+from ai import ImageAnalytics, InferenceExecutor, LocalIngredientDetector
+from config import DefaultConfig
+
+def make_backend(name, args):
+    if name == "local":
+        local_detector = LocalIngredientDetector(
+            args.model_path,
+            args.labels_path,
+            executor=InferenceExecutor(1, 64),
+            max_batch_size=DefaultConfig.LOCAL_IMAGE_MAX_BATCH_SIZE,
+            batch_window_ms=DefaultConfig.LOCAL_IMAGE_BATCH_WINDOW_MS,
+            num_threads=DefaultConfig.LOCAL_IMAGE_THREADS,
+            classes_output=DefaultConfig.LOCAL_IMAGE_CLASSES_OUTPUT,
+            scores_output=DefaultConfig.LOCAL_IMAGE_SCORES_OUTPUT
+        )
+    else:
+        local_detector = None
+    # No detection cache, so every repeat really runs the model
+    return ImageAnalytics(
+        max_dimension=DefaultConfig.IMAGE_MAX_DIMENSION,
+        jpeg_quality=DefaultConfig.IMAGE_JPEG_QUALITY,
+        local_detector=local_detector
+    )
+
+async def time_messages(analytics, messages, repeats):
+    latencies = []
+    detections = []
+    for _ in range(repeats):
+        for images in messages:
+            start = time.perf_counter()
+            detected = await analytics.detect_objects_in_images(images)
+            latencies.append(time.perf_counter() - start)
+            detections.append(detected)
+    return latencies, detections
+
+async def run(args):
+    photos = []
+    for path in args.photos:
+        with open(path, "rb") as f:
+            photos.append(f.read())
+    single = [[photo] for photo in photos]
+    grouped = [
+        photos[start:start + args.photos_per_message]
+            for start in range(0, len(photos), args.photos_per_message)
+    ]
+
+    print(f"{'backend':>8} {'photos/msg':>10} {'median ms':>10} {'p95 ms':>10}")
+    results = {}
+    for name in args.backends:
+        analytics = make_backend(name, args)
+        # Load the model / open the connection before timing
+        await analytics.detect_objects_in_images(photos[:1])
+        for label, messages in (("1", single), (str(args.photos_per_message), grouped)):
+            latencies, detections = await time_messages(analytics, messages, args.repeats)
+            latencies.sort()
+            p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+            print(f"{name:>8} {label:>10} {statistics.median(latencies) * 1000:>10.1f} {p95 * 1000:>10.1f}")
+            if label == "1":
+                results[name] = detections[:len(single)]
+        await analytics.close()
+
+    if "local" in results and "remote" in results:
+        agree = sum(
+            set(local or []) == set(remote or [])
+                for local, remote in zip(results["local"], results["remote"])
+        )
+        print(f"identical ingredients for {agree}/{len(single)} photos")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("photos", nargs="+")
+    parser.add_argument("--backends", nargs="+", choices=["local", "remote"], default=["local", "remote"])
+    parser.add_argument("--photos-per-message", type=int, default=3)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--model-path", default=DefaultConfig.LOCAL_IMAGE_MODEL_PATH)
+    parser.add_argument("--labels-path", default=DefaultConfig.LOCAL_IMAGE_LABELS_PATH)
+    asyncio.run(run(parser.parse_args()))
+
+if __name__ == "__main__":
+    main()
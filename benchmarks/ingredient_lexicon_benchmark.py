@@ -0,0 +1,119 @@
+"""
+Times the local ingredient lexicon against Text Analytics key phrase extraction and
+measures how closely its answers match the service's.
+
+Record the service's key phrases for a file of example inputs (one per line; needs
+COGNITIVE_SERVICES_KEY and COGNITIVE_SERVICES_ENDPOINT):
+    python benchmarks/ingredient_lexicon_benchmark.py --inputs inputs.txt --record recorded.jsonl
+
+Then compare the lexicon with the recording, and time both (from the repository root):
+    python benchmarks/ingredient_lexicon_benchmark.py --compare recorded.jsonl
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "app"))
+
+from ai import TextAnalytics, INGREDIENT_LEXICON
+from ai.ingredient_lexicon import singular
+
+SAMPLE_INPUTS = [
+    "eggs, milk and 2 tomatoes",
+    "chicken breast, rice, onion, garlic, soy sauce",
+    "500g beef mince, 1 tin of tomatoes, 2 carrots & some celery",
+    "I have spinach, feta cheese, a dozen eggs and half a cup of cream",
+    "leftover roast lamb, potatoes and peas",
+]
+
+def normalize(phrases):
+    return {" ".join(singular(word) for word in phrase.lower().split()) for phrase in phrases}
+
+async def record(texts, path):
+    text_analytics = TextAnalytics(cache_max_entries=0)
+    with open(path, "w") as f:
+        for text in texts:
+            key_phrases = await text_analytics.key_phrase_extraction(text)
+            f.write(json.dumps({"text": text, "key_phrases": key_phrases}) + "\n")
+    await text_analytics.close()
+
+async def time_remote(texts):
+    # Without a key phrase cache every call reaches the service
+    text_analytics = TextAnalytics(cache_max_entries=0)
+    latencies = []
+    for text in texts:
+        start = time.perf_counter()
+        await text_analytics.key_phrase_extraction(text)
+        latencies.append(time.perf_counter() - start)
+    await text_analytics.close()
+    return latencies
+
+def compare(recordings):
+    answered = 0
+    exact = 0
+    true_positives = 0
+    predicted = 0
+    expected = 0
+    for recording in recordings:
+        if recording["key_phrases"] is None:
+            continue
+        ingredients = INGREDIENT_LEXICON.extract(recording["text"])
+        if ingredients is None:
+            continue
+        answered += 1
+        local = normalize(ingredients)
+        remote = normalize(recording["key_phrases"])
+        exact += local == remote
+        true_positives += len(local & remote)
+        predicted += len(local)
+        expected += len(remote)
+
+    print(f"answered locally: {answered}/{len(recordings)} inputs")
+    if answered:
+        print(f"identical to the service: {exact}/{answered}")
+        print(f"precision: {true_positives / predicted:.3f}  recall: {true_positives / expected:.3f}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--inputs", help="file with one example input per line")
+    parser.add_argument("--record", help="write the service's key phrases for the inputs to this JSONL file")
+    parser.add_argument("--compare", help="JSONL file written by --record")
+    parser.add_argument("--remote", action="store_true", help="also time the remote service")
+    args = parser.parse_args()
+
+    if args.inputs:
+        with open(args.inputs) as f:
+            texts = [line.strip() for line in f if line.strip()]
+    else:
+        texts = SAMPLE_INPUTS
+
+    if args.record:
+        asyncio.run(record(texts, args.record))
+        return
+
+    recordings = None
+    if args.compare:
+        with open(args.compare) as f:
+            recordings = [json.loads(line) for line in f if line.strip()]
+        texts = [recording["text"] for recording in recordings]
+
+    number = 1000
+    per_call = [
+        min(timeit.repeat(lambda: INGREDIENT_LEXICON.extract_with_coverage(text), number=number, repeat=5)) / number
+            for text in texts
+    ]
+    print(f"lexicon: median {statistics.median(per_call) * 1e6:.1f} us, max {max(per_call) * 1e6:.1f} us per input")
+    if args.remote:
+        latencies = asyncio.run(time_remote(texts))
+        print(f"service: median {statistics.median(latencies) * 1000:.1f} ms, max {max(latencies) * 1000:.1f} ms per input")
+
+    if recordings is not None:
+        compare(recordings)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+Compares recipe generation latency with length-bucketed padding against the
+original fixed padding of every prompt to 256 tokens.
+
+Usage (from the repository root):
+    python benchmarks/recipe_padding_benchmark.py --repeats 3 --max-length 128
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "app"))
+
+from ai.recipe_generation import RecipeGenerator, DEFAULT_LENGTH_BUCKETS
+
+SAMPLE_INPUTS = [
+    "eggs, flour, milk",
+    "chicken, rice, onion, garlic, soy sauce, ginger",
+    "beef mince, tomatoes, onion, garlic, carrots, celery, red wine, "
+    "oregano, basil, spaghetti, parmesan",
+    ", ".join([
+        "potatoes", "leeks", "butter", "chicken stock", "cream", "thyme",
+        "bacon", "cheddar", "spring onions", "sour cream", "black pepper",
+        "nutmeg", "bay leaves", "parsley", "lemon", "olive oil", "shallots",
+        "white wine", "dijon mustard", "chives",
+    ]),
+]
+
+def time_generation(generator, text, repeats):
+    # The first call pays JAX tracing/compilation for this input shape, so exclude it
+    generator.generation_function(text)
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        generator.generation_function(text)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--max-length", type=int, default=512)
+    parser.add_argument("--min-length", type=int, default=64)
+    args = parser.parse_args()
+
+    # Greedy decoding keeps the decoder work comparable between the two runs
+    settings = dict(max_length=args.max_length, min_length=args.min_length, do_sample=False)
+    bucketed = RecipeGenerator(length_buckets=DEFAULT_LENGTH_BUCKETS, **settings)
+    fixed = RecipeGenerator(length_buckets=None, **settings)
+    # Share one set of weights between the two generators
+    fixed.model = bucketed.model
+
+    print(f"{'tokens':>6} {'bucket':>6} {'fixed (s)':>10} {'bucketed (s)':>12} {'speedup':>8}")
+    for text in SAMPLE_INPUTS:
+        tokens = len(bucketed.tokenizer(bucketed.prefix + text).input_ids)
+        fixed_seconds = time_generation(fixed, text, args.repeats)
+        bucketed_seconds = time_generation(bucketed, text, args.repeats)
+        print(
+            f"{tokens:>6} {bucketed.bucket_length(tokens):>6} {fixed_seconds:>10.3f} "
+            f"{bucketed_seconds:>12.3f} {fixed_seconds / bucketed_seconds:>7.2f}x"
+        )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""
+Measures the per-row cost of serializing a SqlRowList in the Functions read handlers:
+the original `json.loads(r.to_json())` per row followed by `json.dumps` of the list,
+against writing the rows straight out as one JSON array or as NDJSON.
+
+Usage (from the repository root, with azure-functions installed):
+    python benchmarks/row_serialization_benchmark.py --rows 10 1000 100000
+"""
+import argparse
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "api"))
+
+import azure.functions as func
+
+from shared_code.serialization import rows_to_json, rows_to_ndjson
+
+def make_rows(count):
+    return func.SqlRowList(
+        func.SqlRow.from_dict({
+            "id": f"29:1{idx:016d}",
+            "userid": f"29:1{idx % 97:016d}",
+            "allergy_ingredient": "peanut butter" if idx % 2 else "shellfish",
+            "name": f"Test User {idx}",
+        })
+        for idx in range(count)
+    )
+
+def original(rows):
+    return json.dumps(list(map(lambda r: json.loads(r.to_json()), rows)))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, nargs="+", default=[10, 1000, 100000])
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    approaches = [("original", original), ("json array", rows_to_json), ("ndjson", rows_to_ndjson)]
+    print(f"{'rows':>8} " + " ".join(f"{name + ' (us/row)':>20}" for name, _ in approaches))
+    for count in args.rows:
+        rows = make_rows(count)
+        assert json.loads(rows_to_json(rows)) == json.loads(original(rows))
+        number = max(1, 100000 // count)
+        per_row = []
+        for _, serialize in approaches:
+            seconds = min(timeit.repeat(lambda: serialize(rows), number=number, repeat=args.repeats))
+            per_row.append(seconds / number / count * 1e6)
+        print(f"{count:>8} " + " ".join(f"{cost:>20.3f}" for cost in per_row))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+import asyncio
+import importlib.util
+import inspect
+import os
+import sys
+
+import pytest
+
+# The bot's packages import each other (and config) from the app directory
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "app"))
+
+FUNCTIONS_DIR = os.path.join(os.path.dirname(__file__), "..", "api")
+
+@pytest.hookimpl(tryfirst=True)
+def pytest_pyfunc_call(pyfuncitem):
+    # Runs `async def` tests on a fresh event loop, so no asyncio plugin is needed
+    if inspect.iscoroutinefunction(pyfuncitem.obj):
+        arguments = {name: pyfuncitem.funcargs[name] for name in pyfuncitem._fixtureinfo.argnames}
+        asyncio.run(pyfuncitem.obj(**arguments))
+        return True
+
+@pytest.fixture
+def load_function(monkeypatch):
+    """
+    Imports an Azure Function from its directory in the function app. The Functions
+    host runs them with the app's root on sys.path, where shared_code lives.
+    """
+    pytest.importorskip("azure.functions")
+    monkeypatch.syspath_prepend(FUNCTIONS_DIR)
+
+    def load(name):
+        spec = importlib.util.spec_from_file_location(
+            "function_" + name, os.path.join(FUNCTIONS_DIR, name, "__init__.py")
+        )
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        return module
+
+    return load
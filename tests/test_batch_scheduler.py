@@ -0,0 +1,62 @@
+import asyncio
+
+import pytest
+
+from ai.batch_scheduler import BatchScheduler
+from ai.inference_executor import InferenceExecutor
+
+@pytest.fixture
+def executor():
+    executor = InferenceExecutor()
+    yield executor
+    executor.shutdown()
+
+def echo_batch(calls):
+    def batch_function(texts, **options):
+        calls.append((list(texts), options))
+        return [f"{text}!" for text in texts]
+    return batch_function
+
+async def test_concurrent_requests_share_a_batch_and_get_their_own_outputs(executor):
+    calls = []
+    scheduler = BatchScheduler(echo_batch(calls), executor, max_batch_size=8, batch_window_ms=20)
+
+    outputs = await asyncio.gather(
+        scheduler.submit(["a", "b"], flag=1),
+        scheduler.submit("c", flag=2),
+    )
+    assert outputs == [["a!", "b!"], ["c!"]]
+    # Options are flattened to one value per input
+    assert calls == [(["a", "b", "c"], {"flag": [1, 1, 2]})]
+
+async def test_requests_are_split_at_max_batch_size(executor):
+    calls = []
+    scheduler = BatchScheduler(echo_batch(calls), executor, max_batch_size=3, batch_window_ms=20)
+
+    outputs = await asyncio.gather(
+        scheduler.submit(["a", "b"]),
+        scheduler.submit(["c", "d"]),
+        scheduler.submit(["e"]),
+    )
+    assert outputs == [["a!", "b!"], ["c!", "d!"], ["e!"]]
+    # The second request would have overfilled the first batch, so it starts a new one
+    assert [texts for texts, _ in calls] == [["a", "b"], ["c", "d", "e"]]
+    assert scheduler.stats()["batches"] == 2
+    assert scheduler.stats()["largest_batch"] == 3
+
+async def test_errors_reach_every_caller_in_the_batch(executor):
+    def failing_batch(texts):
+        raise RuntimeError("boom")
+
+    scheduler = BatchScheduler(failing_batch, executor)
+    results = await asyncio.gather(
+        scheduler.submit("a"), scheduler.submit("b"), return_exceptions=True
+    )
+    assert all(isinstance(result, RuntimeError) for result in results)
+
+async def test_coroutine_batch_function_without_executor():
+    async def batch_function(texts):
+        return [text.upper() for text in texts]
+
+    scheduler = BatchScheduler(batch_function, batch_window_ms=5)
+    assert await asyncio.gather(scheduler.submit("a"), scheduler.submit(["b", "c"])) == [["A"], ["B", "C"]]
@@ -0,0 +1,43 @@
+import json
+
+import pytest
+
+func = pytest.importorskip("azure.functions")
+
+def page(first_id, count):
+    return func.SqlRowList([
+        func.SqlRow.from_dict({
+            "id": id, "userId": "a", "recipe_hash": "h", "recipe": "title: toast",
+            "marked_as_preference": True
+        })
+        for id in range(first_id, first_id + count)
+    ])
+
+def export(load_function, limit, rows):
+    export_preferences = load_function("ExportUserPreferences")
+    request = func.HttpRequest(
+        "GET",
+        "http://localhost/api/preferences/export",
+        params={"after": "0", "limit": limit, "userid": "", "marked_as_preference": ""},
+        body=b""
+    )
+    return export_preferences.main(request, rows)
+
+def test_a_full_page_links_to_the_next_one(load_function):
+    response = export(load_function, "3", page(5, 3))
+    assert response.mimetype == "application/x-ndjson"
+    lines = response.get_body().decode("utf-8").splitlines()
+    assert [json.loads(line)["id"] for line in lines] == [5, 6, 7]
+    assert response.headers["X-Next-After"] == "7"
+
+def test_the_last_page_has_no_next_link(load_function):
+    response = export(load_function, "3", page(5, 2))
+    assert "X-Next-After" not in response.headers
+
+@pytest.mark.parametrize("limit", ["", "0", "abc", "100000"])
+def test_invalid_limits_use_the_default_page_size(load_function, limit):
+    # The query fell back to 1000 rows, so a shorter page is the last one
+    response = export(load_function, limit, page(1, 3))
+    assert "X-Next-After" not in response.headers
+    response = export(load_function, limit, page(1, 1000))
+    assert response.headers["X-Next-After"] == "1000"
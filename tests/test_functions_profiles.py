@@ -0,0 +1,40 @@
+import json
+
+import pytest
+
+func = pytest.importorskip("azure.functions")
+
+def sql_rows(*rows):
+    return func.SqlRowList([func.SqlRow.from_dict(row) for row in rows])
+
+def get(url, headers=None):
+    return func.HttpRequest("GET", url, headers=headers or {}, body=b"")
+
+def test_profile_is_revalidated_with_its_etag(load_function):
+    get_user_profile = load_function("GetUserProfile")
+    rows = sql_rows(
+        {"id": "a", "name": "Ann", "allergy_ingredient": "nuts"},
+        {"id": "a", "name": "Ann", "allergy_ingredient": "egg"},
+    )
+
+    response = get_user_profile.main(get("http://localhost/api/profiles/a"), rows)
+    assert response.status_code == 200
+    assert json.loads(response.get_body()) == {
+        "user": {"id": "a", "name": "Ann"}, "allergies": ["nuts", "egg"]
+    }
+    etag = response.headers["ETag"]
+
+    response = get_user_profile.main(
+        get("http://localhost/api/profiles/a", {"If-None-Match": etag}), rows
+    )
+    assert response.status_code == 304
+    assert response.get_body() == b""
+
+    # A changed profile gets a new ETag
+    changed = sql_rows({"id": "a", "name": "Ann", "allergy_ingredient": None})
+    response = get_user_profile.main(
+        get("http://localhost/api/profiles/a", {"If-None-Match": etag}), changed
+    )
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+    assert json.loads(response.get_body())["allergies"] == []
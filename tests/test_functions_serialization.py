@@ -0,0 +1,41 @@
+import json
+
+import pytest
+
+func = pytest.importorskip("azure.functions")
+
+ROWS = [
+    {"id": "a", "name": "Ann", "joined": None},
+    {"id": "b", "name": "Bé", "joined": None},
+]
+
+def sql_rows(rows):
+    return func.SqlRowList([func.SqlRow.from_dict(row) for row in rows])
+
+def get(url, headers=None, params=None):
+    return func.HttpRequest("GET", url, headers=headers or {}, params=params or {}, body=b"")
+
+def test_rows_are_returned_as_a_json_array(load_function):
+    get_user = load_function("GetUser")
+    response = get_user.main(get("http://localhost/api/users/a"), sql_rows(ROWS))
+    assert response.mimetype == "application/json"
+    assert json.loads(response.get_body()) == ROWS
+
+@pytest.mark.parametrize("request_args", [
+    {"params": {"format": "ndjson"}},
+    {"headers": {"Accept": "application/x-ndjson"}},
+])
+def test_rows_can_be_returned_as_ndjson(load_function, request_args):
+    get_user_allergies = load_function("GetUserAllergies")
+    response = get_user_allergies.main(
+        get("http://localhost/api/allergies/a", **request_args), sql_rows(ROWS)
+    )
+    assert response.mimetype == "application/x-ndjson"
+    lines = response.get_body().decode("utf-8").splitlines()
+    assert [json.loads(line) for line in lines] == ROWS
+
+def test_empty_results(load_function):
+    load_function("GetUser")
+    from shared_code.serialization import rows_to_json, rows_to_ndjson
+    assert rows_to_json(sql_rows([])) == "[]"
+    assert rows_to_ndjson(sql_rows([])) == ""
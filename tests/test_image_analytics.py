@@ -0,0 +1,138 @@
+import io
+import os
+import types
+
+import pytest
+
+pytest.importorskip("azure.cognitiveservices.vision.customvision")
+Image = pytest.importorskip("PIL.Image")
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from ai.cognitive_services import ImageAnalytics
+from ai.image_cache import PerceptualHashCache
+
+COLOURS = {(255, 0, 0): "tomato", (255, 255, 0): "egg", (0, 128, 0): "lettuce"}
+
+def photo(colour, size=(64, 48), format="PNG"):
+    output = io.BytesIO()
+    Image.new("RGB", size, colour).save(output, format=format)
+    return output.getvalue()
+
+class FakePredictionClient:
+    """
+    Detects one ingredient per photo from its colour, like the Custom Vision
+    prediction client would from its contents.
+    """
+
+    def __init__(self):
+        self.uploads = []
+
+    def detect_image(self, project_id, iteration_name, stream):
+        data = stream.read()
+        self.uploads.append(data)
+        image = Image.open(io.BytesIO(data)).convert("RGB")
+        colour = min(COLOURS, key=lambda rgb: sum(
+            (a - b) ** 2 for a, b in zip(rgb, image.getpixel((0, 0)))
+        ))
+        return types.SimpleNamespace(predictions=[
+            types.SimpleNamespace(tag_name=COLOURS[colour], probability=0.9),
+            types.SimpleNamespace(tag_name="plate", probability=0.1),
+        ])
+
+def make_image_analytics(**kwargs):
+    image_analytics = ImageAnalytics(**kwargs)
+    image_analytics.client = FakePredictionClient()
+    return image_analytics
+
+async def test_images_in_memory_are_analysed_together():
+    image_analytics = make_image_analytics()
+    detected = await image_analytics.detect_objects_in_images(
+        [photo((255, 0, 0)), photo((255, 255, 0)), photo((255, 0, 0)), b"not an image"]
+    )
+    await image_analytics.close()
+
+    # Low probability tags and duplicates are left out; the bad image only counts as an error
+    assert detected == ["tomato", "egg"]
+    assert image_analytics.stats()["errors"] == 1
+
+async def test_attachments_are_downloaded_and_oversized_ones_skipped():
+    photos = {"tomato.png": photo((255, 0, 0)), "lettuce.png": photo((0, 128, 0))}
+
+    async def serve(request):
+        name = request.match_info["name"]
+        if name == "huge.png":
+            return web.Response(body=b"\0" * 4096, content_type="image/png")
+        return web.Response(body=photos[name], content_type="image/png")
+
+    app = web.Application()
+    app.router.add_get("/{name}", serve)
+    server = TestServer(app)
+    await server.start_server()
+    image_analytics = make_image_analytics(max_image_bytes=2048)
+    try:
+        attachments = [
+            types.SimpleNamespace(content_url=str(server.make_url("/" + name)))
+            for name in ("tomato.png", "huge.png", "lettuce.png")
+        ]
+        detected = await image_analytics.detect_objects_in_attachments(attachments)
+    finally:
+        await image_analytics.close()
+        await server.close()
+
+    assert detected == ["tomato", "lettuce"]
+    assert image_analytics.stats()["oversized"] == 1
+    assert len(image_analytics.client.uploads) == 2
+
+async def test_no_analysable_images_returns_none():
+    image_analytics = make_image_analytics()
+    assert await image_analytics.detect_objects_in_images([b"not an image"]) is None
+    await image_analytics.close()
+
+def test_large_photos_are_downscaled_to_jpeg():
+    image_analytics = make_image_analytics(max_dimension=32)
+    # Noise, like a real photo, doesn't compress well as a PNG
+    output = io.BytesIO()
+    Image.frombytes("RGB", (200, 100), os.urandom(200 * 100 * 3)).save(output, format="PNG")
+    original = output.getvalue()
+    prepared, _ = image_analytics._prepare(original)
+    image_analytics._executor.shutdown()
+
+    image = Image.open(io.BytesIO(prepared))
+    assert image.format == "JPEG"
+    assert image.size == (32, 16)
+    assert len(prepared) < len(original)
+
+def test_small_jpegs_are_uploaded_as_they_are():
+    image_analytics = make_image_analytics(max_dimension=64)
+    original = photo((255, 0, 0), size=(64, 48), format="JPEG")
+    assert image_analytics._prepare(original)[0] == original
+    # Re-encoding that wouldn't save anything is skipped too
+    small_png = photo((255, 0, 0), size=(200, 100))
+    assert image_analytics._prepare(small_png)[0] == small_png
+    image_analytics._executor.shutdown()
+
+def test_exif_orientation_is_applied_before_re_encoding():
+    image = Image.new("RGB", (200, 100), (255, 0, 0))
+    exif = image.getexif()
+    # Rotated 90 degrees, as phones record portrait photos
+    exif[0x0112] = 6
+    output = io.BytesIO()
+    image.save(output, format="JPEG", exif=exif)
+
+    image_analytics = make_image_analytics(max_dimension=50)
+    prepared, _ = image_analytics._prepare(output.getvalue())
+    image_analytics._executor.shutdown()
+    assert Image.open(io.BytesIO(prepared)).size == (25, 50)
+
+async def test_near_duplicate_photos_reuse_the_cached_detections():
+    image_analytics = make_image_analytics(detection_cache=PerceptualHashCache())
+    first = photo((255, 0, 0), size=(64, 48))
+    resent = photo((250, 5, 5), size=(128, 96), format="JPEG")
+    assert await image_analytics.detect_objects_in_images([first]) == ["tomato"]
+    assert await image_analytics.detect_objects_in_images([resent]) == ["tomato"]
+    await image_analytics.close()
+
+    assert len(image_analytics.client.uploads) == 1
+    assert image_analytics.stats()["detection_cache"]["hits"] == 1
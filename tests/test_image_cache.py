@@ -0,0 +1,42 @@
+import io
+
+import pytest
+
+Image = pytest.importorskip("PIL.Image")
+
+from ai import image_cache
+from ai.image_cache import PerceptualHashCache, perceptual_hash
+
+def gradient(size=(160, 120), flip=False):
+    # Brightness changes left to right, which is what the hash compares
+    image = Image.linear_gradient("L").rotate(90).resize(size).convert("RGB")
+    return image.transpose(Image.FLIP_LEFT_RIGHT) if flip else image
+
+def reencoded(image, size, quality):
+    output = io.BytesIO()
+    image.resize(size).save(output, format="JPEG", quality=quality)
+    return Image.open(io.BytesIO(output.getvalue()))
+
+def distance(a, b):
+    return bin(perceptual_hash(a) ^ perceptual_hash(b)).count("1")
+
+def test_near_duplicate_photos_have_close_hashes():
+    photo = gradient()
+    assert distance(photo, reencoded(photo, (80, 60), quality=40)) <= 6
+    assert distance(photo, gradient(flip=True)) > 6
+
+def test_lookups_match_within_max_distance():
+    cache = PerceptualHashCache(max_distance=2)
+    cache.set(0b1111, ["egg"])
+    assert cache.get(0b1100) == ["egg"]
+    assert cache.get(0b1000) is None
+    assert cache.stats()["saved_predictions"] == 1
+
+def test_entries_expire(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(image_cache.time, "monotonic", lambda: now[0])
+    cache = PerceptualHashCache(ttl_seconds=60)
+    cache.set(1, ["egg"])
+    now[0] += 61
+    assert cache.get(1) is None
+    assert cache.stats()["entries"] == 0
@@ -0,0 +1,44 @@
+import asyncio
+import threading
+
+import pytest
+
+from ai.inference_executor import InferenceExecutor, InferenceQueueFullError
+
+@pytest.fixture
+def executor():
+    executor = InferenceExecutor(max_workers=1, max_queue_depth=1)
+    yield executor
+    executor.shutdown()
+
+async def test_blocking_work_runs_off_the_event_loop(executor):
+    release = threading.Event()
+    task = asyncio.ensure_future(executor.run(lambda: release.wait(5) and threading.current_thread().name))
+
+    # The loop keeps running while the worker is blocked
+    await asyncio.sleep(0.01)
+    assert not task.done()
+    release.set()
+    assert (await task).startswith("inference")
+
+async def test_requests_beyond_the_queue_depth_are_rejected(executor):
+    release = threading.Event()
+    running = asyncio.ensure_future(executor.run(release.wait, 5))
+    queued = asyncio.ensure_future(executor.run(lambda: "queued"))
+    await asyncio.sleep(0.01)
+
+    with pytest.raises(InferenceQueueFullError):
+        await executor.run(lambda: "rejected")
+    release.set()
+    assert await running
+    assert await queued == "queued"
+    stats = executor.stats()
+    assert (stats["completed"], stats["rejected"], stats["in_flight"]) == (2, 1, 0)
+
+async def test_errors_are_raised_to_the_caller_and_counted(executor):
+    def fail():
+        raise ValueError("bad input")
+
+    with pytest.raises(ValueError):
+        await executor.run(fail)
+    assert executor.stats()["failed"] == 1
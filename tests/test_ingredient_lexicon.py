@@ -0,0 +1,42 @@
+from ai.ingredient_lexicon import IngredientLexicon, singular
+
+LEXICON = IngredientLexicon(
+    ["egg", "milk", "tomato", "chicken", "chicken breast", "soy sauce", "garlic", "cinnamon", "pea"]
+)
+
+def test_longest_phrase_wins():
+    ingredients, coverage = LEXICON.extract_with_coverage("chicken breast, soy sauce and garlic")
+    assert ingredients == ["chicken breast", "soy sauce", "garlic"]
+    assert coverage == 1.0
+
+def test_quantities_units_and_plurals_are_skipped():
+    ingredients, coverage = LEXICON.extract_with_coverage("2 cloves of garlic, a dozen eggs & 500ml milk")
+    assert ingredients == ["garlic", "eggs", "milk"]
+    assert coverage == 1.0
+    assert LEXICON.extract("frozen peas and a can of tomatoes") == ["peas", "tomatoes"]
+
+def test_units_on_their_own_are_not_skipped():
+    # "cloves" is the spice here, which isn't in the vocabulary
+    ingredients, coverage = LEXICON.extract_with_coverage("cinnamon and cloves")
+    assert ingredients == ["cinnamon"]
+    assert coverage == 0.5
+    assert LEXICON.extract("cinnamon and cloves") is None
+    assert LEXICON.extract("eggs, fresh") is None
+    assert LEXICON.extract("milk, 2 heads") is None
+
+def test_unknown_words_lower_coverage_and_fall_back():
+    ingredients, coverage = LEXICON.extract_with_coverage("eggs and dragonfruit")
+    assert ingredients == ["eggs"]
+    assert coverage == 0.5
+    assert LEXICON.extract("eggs and dragonfruit") is None
+    assert LEXICON.extract("eggs, tomatoes") == ["eggs", "tomatoes"]
+
+def test_repeated_ingredients_are_returned_once():
+    assert LEXICON.extract("milk, milk and more milk") is None
+    assert LEXICON.extract("milk, milk") == ["milk"]
+
+def test_singular():
+    assert singular("tomatoes") == "tomato"
+    assert singular("berries") == "berry"
+    assert singular("leaves") == "leaf"
+    assert singular("asparagus") == "asparagus"
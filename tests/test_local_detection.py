@@ -0,0 +1,111 @@
+import asyncio
+import io
+
+import pytest
+
+onnx = pytest.importorskip("onnx")
+pytest.importorskip("onnxruntime")
+Image = pytest.importorskip("PIL.Image")
+
+from onnx import TensorProto, helper
+
+from ai.inference_executor import InferenceExecutor
+from ai.local_detection import LocalIngredientDetector
+from config import DefaultConfig
+
+def write_model(path, batch_size="batch"):
+    """
+    A stand-in for the exported detector: one detection per image, "light" when its
+    mean brightness is over a half and "dark" otherwise, scored by that brightness.
+    """
+    brightness = helper.make_node(
+        "ReduceMean", ["image_tensor"], ["brightness"], axes=[1, 2, 3], keepdims=0
+    )
+    axes = helper.make_tensor("axes", TensorProto.INT64, [1], [1])
+    half = helper.make_tensor("half", TensorProto.FLOAT, [], [0.5])
+    graph = helper.make_graph(
+        [
+            brightness,
+            helper.make_node("Unsqueeze", ["brightness", "axes"], ["detected_scores"]),
+            helper.make_node("Greater", ["detected_scores", "half"], ["is_light"]),
+            helper.make_node("Cast", ["is_light"], ["detected_classes"], to=TensorProto.INT64),
+        ],
+        "detector",
+        [helper.make_tensor_value_info("image_tensor", TensorProto.FLOAT, [batch_size, 3, 8, 8])],
+        [
+            helper.make_tensor_value_info("detected_classes", TensorProto.INT64, [batch_size, 1]),
+            helper.make_tensor_value_info("detected_scores", TensorProto.FLOAT, [batch_size, 1]),
+        ],
+        initializer=[axes, half],
+    )
+    model = helper.make_model(graph, opset_imports=[helper.make_opsetid("", 13)])
+    model.ir_version = 8
+    onnx.save(model, str(path))
+    return str(path)
+
+@pytest.fixture
+def labels_path(tmp_path):
+    path = tmp_path / "labels.txt"
+    path.write_text("dark\nlight\n")
+    return str(path)
+
+def photo(grey):
+    output = io.BytesIO()
+    Image.new("RGB", (16, 16), (grey, grey, grey)).save(output, format="PNG")
+    return output.getvalue()
+
+def detections(results):
+    return [[(label, round(score, 2)) for label, score in result] for result in results]
+
+def test_images_are_detected_in_one_batch(tmp_path, labels_path):
+    detector = LocalIngredientDetector(
+        write_model(tmp_path / "model.onnx"), labels_path, InferenceExecutor()
+    )
+    assert detector.fixed_batch_size is None
+    results = detector._detect_batch([photo(0), photo(255), photo(51)])
+    detector.executor.shutdown()
+    assert detections(results) == [[("dark", 0.0)], [("light", 1.0)], [("dark", 0.2)]]
+
+def test_fixed_size_batches_are_padded(tmp_path, labels_path):
+    detector = LocalIngredientDetector(
+        write_model(tmp_path / "model.onnx", batch_size=2), labels_path, InferenceExecutor()
+    )
+    batch_sizes = []
+    run = detector._run
+
+    def recording_run(batch):
+        batch_sizes.append(len(batch))
+        return run(batch)
+
+    detector._run = recording_run
+    results = detector._detect_batch([photo(0), photo(255), photo(255)])
+    detector.executor.shutdown()
+
+    # Three images take two full batches, and the padding's results are dropped
+    assert batch_sizes == [2, 2]
+    assert detections(results) == [[("dark", 0.0)], [("light", 1.0)], [("light", 1.0)]]
+
+def test_output_names_are_checked_when_loading(tmp_path, labels_path):
+    with pytest.raises(ValueError, match="no output named 'scores'"):
+        LocalIngredientDetector(
+            write_model(tmp_path / "model.onnx"), labels_path, InferenceExecutor(),
+            scores_output="scores"
+        )
+
+def test_a_model_that_cannot_be_loaded_falls_back_to_the_service(tmp_path, monkeypatch):
+    pytest.importorskip("azure.cognitiveservices.vision.customvision")
+    from ai import cognitive_services
+
+    monkeypatch.setattr(DefaultConfig, "IMAGE_ANALYTICS_BACKEND", "local")
+    monkeypatch.setattr(DefaultConfig, "LOCAL_IMAGE_MODEL_PATH", str(tmp_path / "missing.onnx"))
+    assert cognitive_services._load_local_detector() is None
+
+async def test_concurrent_photos_share_a_batch(tmp_path, labels_path):
+    detector = LocalIngredientDetector(
+        write_model(tmp_path / "model.onnx"), labels_path, InferenceExecutor()
+    )
+    results = await asyncio.gather(*(detector.detect(photo(grey)) for grey in (0, 255)))
+    detector.executor.shutdown()
+
+    assert detections(results) == [[("dark", 0.0)], [("light", 1.0)]]
+    assert detector.stats()["executor"]["completed"] == 1
@@ -0,0 +1,79 @@
+import jax
+import jax.numpy as jnp
+import numpy as np
+import pytest
+
+pytest.importorskip("transformers")
+
+from ai.logits_processors import (
+    FlaxBannedSequencesLogitsProcessor,
+    FlaxEarlyStopLogitsProcessor,
+    banned_sequence_arrays
+)
+
+VOCAB_SIZE = 6
+EOS = 1
+
+def banned_tokens(scores):
+    return [np.flatnonzero(np.isneginf(row)).tolist() for row in np.asarray(scores)]
+
+def test_banned_sequences_are_per_row():
+    # Row 0 may not say 2 then 3, or 4 at all; row 1 bans nothing
+    processor = FlaxBannedSequencesLogitsProcessor.from_sequences([[[2, 3], [4]], []])
+    input_ids = jnp.asarray([[0, 5, 2, 0, 0], [0, 5, 2, 0, 0]])
+    scores = jnp.zeros((2, VOCAB_SIZE))
+
+    assert banned_tokens(processor(input_ids, scores, 3)) == [[3, 4], []]
+    # After a different token only the single-token sequence applies
+    assert banned_tokens(processor(input_ids, scores, 2)) == [[4], []]
+
+def test_banned_sequences_follow_repeated_rows():
+    # Each input repeated for two candidates
+    processor = FlaxBannedSequencesLogitsProcessor.from_sequences([[[4]], []])
+    input_ids = jnp.zeros((4, 3), dtype=jnp.int32)
+    scores = jnp.zeros((4, VOCAB_SIZE))
+    assert banned_tokens(processor(input_ids, scores, 1)) == [[4], [4], [], []]
+
+def test_banned_sequence_arrays_keep_a_fixed_shape():
+    banned, active = banned_sequence_arrays([[[2, 3]], []], max_sequences=4, max_tokens=4)
+    assert banned.shape == (2, 4, 4)
+    assert banned[0, 0].tolist() == [-1, -1, 2, 3]
+    assert active.tolist() == [[True, False, False, False], [False] * 4]
+
+    # Grows to the next power of two rather than dropping sequences
+    banned, active = banned_sequence_arrays([[[1]] * 5], max_sequences=4, max_tokens=4)
+    assert banned.shape == (1, 8, 4)
+    assert active.sum() == 5
+
+def test_banned_sequences_can_be_traced():
+    input_ids = jnp.asarray([[0, 5, 2, 0]])
+    scores = jnp.zeros((1, VOCAB_SIZE))
+
+    @jax.jit
+    def apply(banned, active):
+        return FlaxBannedSequencesLogitsProcessor(banned, active)(input_ids, scores, 3)
+
+    for sequences, expected in (([[2, 3]], [[3]]), ([[4]], [[4]]), ([], [[]])):
+        arrays = banned_sequence_arrays([sequences], max_sequences=2, max_tokens=2)
+        assert banned_tokens(apply(*arrays)) == expected
+    # Every banned list had the same shape, so it was only compiled once
+    assert apply._cache_size() == 1
+
+def test_early_stop_only_in_the_final_section():
+    processor = FlaxEarlyStopLogitsProcessor([5], EOS, eos_probability=0.1)
+    # Row 0 has started the final section; row 1 only will at position 3, not yet generated
+    input_ids = jnp.asarray([[0, 5, 2, 0], [0, 2, 2, 5]])
+    scores = jnp.zeros((2, VOCAB_SIZE))
+
+    forced = np.asarray(processor(input_ids, scores, 3))
+    assert forced[0].argmax() == EOS
+    assert banned_tokens(forced) == [[0, 2, 3, 4, 5], []]
+
+def test_early_stop_waits_until_eos_is_likely():
+    processor = FlaxEarlyStopLogitsProcessor([5], EOS, eos_probability=0.5)
+    input_ids = jnp.asarray([[0, 5, 2, 0]])
+    scores = jnp.zeros((1, VOCAB_SIZE))
+    assert banned_tokens(processor(input_ids, scores, 3)) == [[]]
+
+    likely_eos = scores.at[0, EOS].set(10.0)
+    assert np.asarray(processor(input_ids, likely_eos, 3))[0].argmax() == EOS
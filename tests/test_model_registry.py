@@ -0,0 +1,103 @@
+import asyncio
+
+import pytest
+
+from ai.inference_executor import InferenceExecutor
+from ai.model_registry import ModelRegistry
+from ai.recipe_cache import RecipeCache
+
+class StubGenerator:
+    """
+    Stands in for RecipeGenerator: every recipe just names its input.
+    """
+
+    def __init__(self):
+        self.calls = []
+
+    def generate_candidates(self, texts, banned_words=None, num_candidates=1, num_results=1):
+        self.calls.append(("generate", list(texts), banned_words))
+        return [[f"title: {text}"] for text in texts]
+
+    def stream_generation(self, texts, banned_words=None, num_candidates=1):
+        self.calls.append(("stream", list(texts), banned_words))
+        for section in ("title:", "ingredients:", "directions:"):
+            for idx, text in enumerate(texts):
+                yield idx, f"{section} {text}"
+
+    def warm_up(self, batch_sizes, num_candidates=1, stream=False):
+        self.calls.append(("warm_up", list(batch_sizes), stream))
+
+def refuse_to_load():
+    raise AssertionError("the real model should not be loaded")
+
+@pytest.fixture
+def registry():
+    registry = ModelRegistry(generator_factory=refuse_to_load, executor=InferenceExecutor())
+    registry.set_generator(StubGenerator())
+    yield registry
+    registry.executor.shutdown()
+
+def test_set_generator_marks_the_registry_ready(registry):
+    assert registry.is_loaded
+    assert registry.is_ready
+    assert isinstance(registry.load(), StubGenerator)
+
+def test_the_generator_is_loaded_once():
+    loads = []
+
+    def factory():
+        loads.append(1)
+        return StubGenerator()
+
+    registry = ModelRegistry(generator_factory=factory, executor=InferenceExecutor())
+    assert not registry.is_loaded
+    assert registry.load() is registry.load()
+    assert len(loads) == 1
+    registry.executor.shutdown()
+
+async def test_generate_recipes_uses_the_shared_generator(registry):
+    assert await registry.generate_recipes(["egg", "milk"]) == ["title: egg", "title: milk"]
+    assert registry.load().calls == [("generate", ["egg", "milk"], [None, None])]
+
+async def test_concurrent_requests_share_one_decode(registry):
+    outputs = await asyncio.gather(
+        registry.generate_recipes(["egg", "milk"], allergies=["nuts"]),
+        registry.generate_recipes("rice"),
+    )
+    assert outputs == [["title: egg", "title: milk"], ["title: rice"]]
+    # Banned words are passed per input
+    assert registry.load().calls == [("generate", ["egg", "milk", "rice"], [["nuts"], ["nuts"], None])]
+
+async def test_stream_recipes_yields_each_inputs_sections(registry):
+    sections = [item async for item in registry.stream_recipes(["egg", "milk"], allergies=["nuts"])]
+    assert sorted(sections) == [
+        (0, "directions: egg"), (0, "ingredients: egg"), (0, "title: egg"),
+        (1, "directions: milk"), (1, "ingredients: milk"), (1, "title: milk"),
+    ]
+    # Both inputs were decoded in one batch, each in order
+    assert [section for idx, section in sections if idx == 0] == [
+        "title: egg", "ingredients: egg", "directions: egg"
+    ]
+    assert registry.load().calls == [("stream", ["egg", "milk"], [["nuts"], ["nuts"]])]
+
+def test_warm_up_compiles_streaming_when_asked(registry):
+    registry.warm_up(stream=True)
+    assert registry.load().calls == [("warm_up", list(range(1, 9)), True)]
+    assert registry.is_ready
+
+async def test_only_uncached_prompts_are_generated(registry):
+    registry.recipe_cache = RecipeCache(pool_size=1)
+    await registry.generate_recipes(["egg"])
+
+    assert await registry.generate_recipes(["milk", "egg"]) == ["title: milk", "title: egg"]
+    assert registry.load().calls[-1] == ("generate", ["milk"], [None])
+
+async def test_only_uncached_prompts_are_streamed(registry):
+    registry.recipe_cache = RecipeCache(pool_size=1)
+    [item async for item in registry.stream_recipes(["egg"])]
+
+    sections = [item async for item in registry.stream_recipes(["milk", "egg"])]
+    # The cached recipe comes first, under its own index
+    assert sections[:3] == [(1, "title: egg"), (1, "ingredients: egg"), (1, "directions: egg")]
+    assert sections[3:] == [(0, "title: milk"), (0, "ingredients: milk"), (0, "directions: milk")]
+    assert registry.load().calls[-1] == ("stream", ["milk"], [None])
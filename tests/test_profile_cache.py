@@ -0,0 +1,56 @@
+import pytest
+
+from api import profile_cache
+from api.profile_cache import ProfileCache
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(profile_cache.time, "monotonic", lambda: now[0])
+    return now
+
+def test_missing_users_use_the_negative_ttl(clock):
+    cache = ProfileCache(ttl_seconds=300, negative_ttl_seconds=30)
+    cache.set("known", {"id": "known"})
+    cache.set("missing", None)
+
+    clock[0] += 29
+    assert cache.get("missing") == (True, None)
+    clock[0] += 2
+    assert cache.get("missing") == (False, None)
+    assert cache.get("known") == (True, {"id": "known"})
+    clock[0] += 300
+    assert cache.get("known") == (False, None)
+
+def test_explicit_ttl_overrides_the_defaults(clock):
+    cache = ProfileCache(ttl_seconds=300)
+    cache.set("etag", '"v1"', ttl_seconds=5)
+    clock[0] += 6
+    assert cache.get("etag") == (False, None)
+
+def test_least_recently_used_entry_is_evicted(clock):
+    cache = ProfileCache(max_entries=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert cache.get("b") == (False, None)
+    assert cache.get("a") == (True, 1)
+
+async def test_get_or_load_caches_not_found_results():
+    cache = ProfileCache()
+    loads = []
+
+    async def load():
+        loads.append(1)
+        return None
+
+    assert [await cache.get_or_load("ghost", load) for _ in range(2)] == [None, None]
+    assert len(loads) == 1
+
+def test_invalidate_forces_a_reload(clock):
+    cache = ProfileCache()
+    cache.set("user", {"allergies": []})
+    cache.invalidate("user")
+    assert cache.get("user") == (False, None)
+    assert cache.stats()["invalidations"] == 1
@@ -0,0 +1,58 @@
+import types
+
+import pytest
+
+pytest.importorskip("botbuilder.dialogs")
+
+from botbuilder.core import ConversationState, MemoryStorage, UserState
+
+from dialogs.provide_ingredients_dialog import ProvideIngredientsDialog
+
+class StreamingRegistry:
+    """
+    Streams fixed recipes, the way ModelRegistry.stream_recipes yields them.
+    """
+
+    def __init__(self, recipes):
+        self.recipes = recipes
+
+    async def stream_recipes(self, texts, allergies=None):
+        for section in range(3):
+            for idx, recipe in enumerate(self.recipes):
+                yield idx, recipe[section]
+
+class SentActivities:
+    def __init__(self):
+        self.texts = []
+
+    async def send_activity(self, activity):
+        text = activity if isinstance(activity, str) else activity.text
+        if text:
+            self.texts.append(text)
+
+def stream(recipes, allergies):
+    storage = MemoryStorage()
+    dialog = ProvideIngredientsDialog(
+        UserState(storage), ConversationState(storage), StreamingRegistry(recipes)
+    )
+    sent = SentActivities()
+    step_context = types.SimpleNamespace(context=sent)
+    return dialog.stream_recipes(step_context, [str(idx) for idx in range(len(recipes))], allergies), sent
+
+async def test_streamed_recipes_with_an_allergen_are_never_sent():
+    recipes = [
+        ["title: pancakes", "ingredients: flour -- Peanut butter", "directions: mix"],
+        ["title: omelette", "ingredients: eggs", "directions: whisk"],
+    ]
+    results, sent = stream(recipes, ["peanut"])
+    assert await results == ["title: omelette\ningredients: eggs\ndirections: whisk"]
+    assert len(sent.texts) == 2
+    assert not any("Peanut" in text for text in sent.texts)
+
+async def test_a_recipe_is_cut_short_if_its_directions_mention_an_allergen():
+    recipes = [["title: toast", "ingredients: bread", "directions: spread the peanut butter"]]
+    results, sent = stream(recipes, ["peanut"])
+    assert await results == []
+    assert "Toast" in sent.texts[0]
+    assert "allergic" in sent.texts[-1]
+    assert not any("peanut" in text.lower() for text in sent.texts)
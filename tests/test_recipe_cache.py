@@ -0,0 +1,56 @@
+import pytest
+
+from ai import recipe_cache
+from ai.recipe_cache import DiskCacheBackend, MemoryCacheBackend, RecipeCache
+
+@pytest.fixture(params=["memory", "disk"])
+def backend(request, tmp_path):
+    if request.param == "disk":
+        return DiskCacheBackend(str(tmp_path / "recipe_cache.sqlite3"))
+    return MemoryCacheBackend()
+
+def test_each_prompt_is_cached_on_its_own(backend):
+    cache = RecipeCache(backend, pool_size=1)
+    cache.add(["Egg", "milk"], [["egg recipe"], ["milk recipe"]], {"num_candidates": 3})
+
+    # Hits ignore case and which other prompts were asked for alongside
+    assert cache.get(["rice", "MILK", "egg"], {"num_candidates": 3}) == [
+        None, ["milk recipe"], ["egg recipe"]
+    ]
+    # Different generation kwargs are a different entry
+    assert cache.get(["egg"], {"num_candidates": 1}) == [None]
+    assert cache.stats()["hits"] == 2
+
+def test_misses_until_the_pool_is_full(backend):
+    cache = RecipeCache(backend, pool_size=2)
+    cache.add("egg", [["first"]])
+    assert cache.get("egg") == [None]
+    cache.add("egg", [["second"]])
+    assert cache.get("egg")[0] in (["first"], ["second"])
+
+def test_least_recently_used_entry_is_evicted(monkeypatch, backend):
+    # The disk backend orders entries by access time
+    now = [1000.0]
+    monkeypatch.setattr(recipe_cache.time, "time", lambda: now[0])
+    cache = RecipeCache(backend, max_entries=2, pool_size=1)
+    for text in ("a", "b"):
+        cache.add(text, [[text]])
+        now[0] += 1
+    cache.get("a")
+    now[0] += 1
+    cache.add("c", [["c"]])
+
+    assert cache.get(["a", "b", "c"]) == [["a"], None, ["c"]]
+    assert cache.stats()["evictions"] == 1
+
+def test_entries_expire_after_the_ttl(monkeypatch, backend):
+    now = [1000.0]
+    monkeypatch.setattr(recipe_cache.time, "time", lambda: now[0])
+    cache = RecipeCache(backend, ttl_seconds=60, pool_size=1)
+    cache.add("egg", [["recipe"]])
+
+    now[0] += 59
+    assert cache.get("egg") == [["recipe"]]
+    now[0] += 2
+    assert cache.get("egg") == [None]
+    assert cache.stats()["expirations"] == 1
@@ -0,0 +1,36 @@
+import pytest
+
+pytest.importorskip("transformers")
+
+from ai.recipe_generation import RecipeGenerator
+
+@pytest.fixture
+def generator():
+    # Only the bucketing attributes; no model or tokenizer is loaded
+    generator = RecipeGenerator.__new__(RecipeGenerator)
+    generator.max_input_length = 256
+    generator.length_buckets = [16, 32, 64, 128, 256]
+    generator.batch_buckets = [1, 2, 4, 8]
+    return generator
+
+def test_prompts_are_padded_to_the_smallest_bucket_that_fits(generator):
+    assert [generator.bucket_length(length) for length in (1, 16, 17, 100, 256)] == [
+        16, 16, 32, 128, 256
+    ]
+    # Longer prompts are truncated to max_input_length
+    assert generator.bucket_length(300) == 256
+
+def test_batches_are_padded_to_a_batch_bucket(generator):
+    assert [generator.bucket_batch_size(size) for size in range(1, 10)] == [
+        1, 2, 4, 4, 8, 8, 8, 8, 16
+    ]
+
+def test_batches_are_padded_with_copies_of_the_last_input(generator):
+    inputs, banned_words, num_candidates, num_inputs = generator._prepare_batch(
+        ["egg", "milk", "rice"], ["nuts"], num_candidates=2
+    )
+    assert inputs == ["egg", "milk", "rice", "rice"]
+    # Padding rows ban nothing and are dropped by the caller
+    assert banned_words == [["nuts"], ["nuts"], ["nuts"], []]
+    assert num_candidates == [2, 2, 2, 2]
+    assert num_inputs == 3
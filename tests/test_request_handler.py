@@ -0,0 +1,202 @@
+import contextlib
+import json
+import urllib.parse
+
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from api import request_handler
+from api.client import ApiClient, ApiError
+from api.profile_cache import ProfileCache
+from api.write_behind import WriteBehindQueue
+from config import DefaultConfig
+
+@contextlib.asynccontextmanager
+async def api_server(monkeypatch, routes):
+    """
+    Serves routes ({(method, path): handler}) as the Functions API, and points the
+    request handler's client, caches and write queue at it.
+    """
+    app = web.Application()
+    for (method, path), handler in routes.items():
+        app.router.add_route(method, "/api/" + path, handler)
+    server = TestServer(app)
+    await server.start_server()
+
+    client = ApiClient(str(server.make_url("/api/")))
+    monkeypatch.setattr(request_handler, "CLIENT", client)
+    monkeypatch.setattr(request_handler, "PROFILE_CACHE", ProfileCache())
+    monkeypatch.setattr(request_handler, "STORED_RECIPES", ProfileCache())
+    monkeypatch.setattr(request_handler, "WRITE_QUEUE", WriteBehindQueue(
+        client,
+        bulk_paths=["allergies", "preferences"],
+        single_paths=["users"],
+        max_retries=0,
+        preparers={"preferences": request_handler._store_recipes}
+    ))
+    try:
+        yield
+    finally:
+        await request_handler.WRITE_QUEUE.close()
+        await client.close()
+        await server.close()
+
+def test_query_batches_stay_under_the_length_limit(monkeypatch):
+    monkeypatch.setattr(DefaultConfig, "API_MAX_QUERY_LENGTH", 300)
+    hashes = [request_handler.recipe_hash(str(idx)) for idx in range(20)]
+
+    batches = list(request_handler._query_batches("hashes", hashes))
+    assert len(batches) > 1
+    assert [h for batch in batches for h in batch] == hashes
+    for batch in batches:
+        assert len(urllib.parse.urlencode({"hashes": json.dumps(batch)})) <= 300
+
+    assert [len(batch) for batch in request_handler._query_batches("ids", ["a"] * 5, max_items=2)] == [2, 2, 1]
+
+async def test_only_missing_recipes_are_uploaded(monkeypatch):
+    monkeypatch.setattr(DefaultConfig, "API_MAX_QUERY_LENGTH", 300)
+    stored = {request_handler.recipe_hash("pancakes"): "pancakes"}
+    queries, preferences = [], []
+
+    async def missing(request):
+        queries.append(request.query_string)
+        hashes = json.loads(request.query["hashes"])
+        return web.json_response([h for h in hashes if h not in stored])
+
+    async def add_recipes(request):
+        for row in await request.json():
+            stored[row["hash"]] = row["recipe"]
+        return web.json_response([], status=201)
+
+    async def add_preferences(request):
+        preferences.extend(await request.json())
+        return web.json_response([], status=201)
+
+    recipes = ["pancakes"] + [f"recipe {idx}" for idx in range(10)]
+    async with api_server(monkeypatch, {
+        ("GET", "recipes/missing"): missing,
+        ("POST", "recipes"): add_recipes,
+        ("POST", "preferences"): add_preferences,
+    }):
+        await request_handler.add_user_preferences(
+            "user", [{"recipe": recipe, "marked_as_preference": True} for recipe in recipes]
+        )
+        await request_handler.WRITE_QUEUE.flush()
+
+    # The hashes were checked in several short queries
+    assert len(queries) > 1
+    assert all(len(query) <= 300 for query in queries)
+    assert sorted(stored.values()) == sorted(recipes)
+    assert preferences == [
+        {"userId": "user", "recipe_hash": request_handler.recipe_hash(recipe), "marked_as_preference": True}
+        for recipe in recipes
+    ]
+
+async def test_preferences_for_recipes_that_failed_to_upload_are_dropped(monkeypatch):
+    preferences = []
+
+    async def missing(request):
+        return web.json_response(json.loads(request.query["hashes"]))
+
+    async def reject_recipes(request):
+        return web.Response(status=400)
+
+    async def add_preferences(request):
+        preferences.extend(await request.json())
+        return web.json_response([], status=201)
+
+    async with api_server(monkeypatch, {
+        ("GET", "recipes/missing"): missing,
+        ("POST", "recipes"): reject_recipes,
+        ("POST", "preferences"): add_preferences,
+    }):
+        await request_handler.add_user_preferences(
+            "user", [{"recipe": "pancakes", "marked_as_preference": False}]
+        )
+        await request_handler.WRITE_QUEUE.flush()
+        assert not request_handler.STORED_RECIPES.get(request_handler.recipe_hash("pancakes"))[0]
+
+    assert preferences == []
+
+async def test_profiles_are_looked_up_in_short_batches(monkeypatch):
+    monkeypatch.setattr(DefaultConfig, "API_MAX_QUERY_LENGTH", 300)
+    monkeypatch.setattr(DefaultConfig, "PROFILE_BATCH_SIZE", 50)
+    # Channel user ids can be long
+    ids = [f"29:{'x' * 60}{idx}" for idx in range(10)]
+    queries = []
+
+    async def profiles(request):
+        queries.append(request.query_string)
+        return web.json_response([
+            {"user": {"id": id}, "allergies": ["nuts"]}
+            for id in json.loads(request.query["ids"]) if id != ids[0]
+        ])
+
+    async with api_server(monkeypatch, {("GET", "profiles"): profiles}):
+        found = await request_handler.get_user_profiles(ids)
+        # Every id is now cached, including the unknown one
+        assert await request_handler.get_user_profile(ids[0]) == (None, [])
+
+    assert len(queries) > 1
+    assert all(len(query) <= 300 for query in queries)
+    assert found[ids[0]] == (None, [])
+    assert found[ids[1]] == ({"id": ids[1]}, ["nuts"])
+
+async def test_ids_in_a_failed_batch_are_looked_up_again(monkeypatch):
+    monkeypatch.setattr(DefaultConfig, "PROFILE_BATCH_SIZE", 2)
+    single_lookups = []
+
+    async def profiles(request):
+        batch = json.loads(request.query["ids"])
+        if "b" in batch:
+            return web.Response(status=500)
+        return web.json_response([{"user": {"id": id}, "allergies": []} for id in batch])
+
+    async def profile(request):
+        single_lookups.append(request.match_info["id"])
+        return web.json_response({"user": {"id": request.match_info["id"]}, "allergies": ["egg"]})
+
+    async with api_server(monkeypatch, {
+        ("GET", "profiles"): profiles,
+        ("GET", "profiles/{id}"): profile,
+    }):
+        found = await request_handler.get_user_profiles(["a", "c", "b", "d"])
+        # The failed batch wasn't cached as missing users
+        assert await request_handler.get_user_profile("b") == ({"id": "b"}, ["egg"])
+
+    assert found == {"a": ({"id": "a"}, []), "c": ({"id": "c"}, [])}
+    assert single_lookups == ["b"]
+
+async def test_cached_profiles_are_revalidated_with_their_etag(monkeypatch):
+    requests = []
+
+    async def profile(request):
+        requests.append(request.headers.get("If-None-Match"))
+        if request.headers.get("If-None-Match") == '"v1"':
+            return web.Response(status=304, headers={"ETag": '"v1"'})
+        return web.json_response(
+            {"user": {"id": "a"}, "allergies": ["nuts"]}, headers={"ETag": '"v1"'}
+        )
+
+    async with api_server(monkeypatch, {("GET", "profiles/{id}"): profile}):
+        assert await request_handler.get_user_profile("a") == ({"id": "a"}, ["nuts"])
+        # Served from the cache until it expires
+        assert await request_handler.get_user_profile("a") == ({"id": "a"}, ["nuts"])
+        request_handler.PROFILE_CACHE.invalidate(("user", "a"))
+        assert await request_handler.get_user_profile("a") == ({"id": "a"}, ["nuts"])
+
+    assert requests == [None, '"v1"']
+
+async def test_failed_profile_lookups_are_not_cached(monkeypatch):
+    statuses = [500, 404]
+
+    async def profile(request):
+        return web.Response(status=statuses.pop(0))
+
+    async with api_server(monkeypatch, {("GET", "profiles/{id}"): profile}):
+        with pytest.raises(ApiError):
+            await request_handler.get_user_profile("a")
+        # The failure didn't turn the user into a missing one, but a 404 does
+        assert await request_handler.get_user_profile("a") == (None, [])
+        assert await request_handler.get_user_profile("a") == (None, [])
@@ -0,0 +1,67 @@
+import asyncio
+import types
+
+import pytest
+
+pytest.importorskip("azure.ai.textanalytics")
+pytest.importorskip("PIL")
+
+from ai.cognitive_services import TextAnalytics
+
+class FakeTextAnalyticsClient:
+    """
+    Answers like the Text Analytics client: every word of a document is a key phrase,
+    and documents containing "error" fail on their own.
+    """
+
+    def __init__(self):
+        self.calls = []
+
+    async def extract_key_phrases(self, documents):
+        self.calls.append(list(documents))
+        return [
+            types.SimpleNamespace(id=str(idx), is_error=True, error="bad document")
+            if "error" in document else
+            types.SimpleNamespace(id=str(idx), is_error=False, key_phrases=document.split())
+            for idx, document in enumerate(documents)
+        ]
+
+def make_text_analytics(**kwargs):
+    text_analytics = TextAnalytics(**kwargs)
+    text_analytics.client = FakeTextAnalyticsClient()
+    return text_analytics
+
+async def test_key_phrases_are_cached_by_normalized_text():
+    text_analytics = make_text_analytics()
+    assert await text_analytics.key_phrase_extraction("Eggs  milk") == ["eggs", "milk"]
+    assert await text_analytics.key_phrase_extraction("eggs MILK") == ["eggs", "milk"]
+
+    assert text_analytics.client.calls == [["eggs milk"]]
+    assert text_analytics.stats()["hits"] == 1
+
+async def test_least_recently_used_results_are_evicted():
+    text_analytics = make_text_analytics(cache_max_entries=2)
+    for text in ("egg", "milk", "egg", "rice"):
+        await text_analytics.key_phrase_extraction(text)
+    await text_analytics.key_phrase_extraction("milk")
+    assert text_analytics.client.calls == [["egg"], ["milk"], ["rice"], ["milk"]]
+
+async def test_failures_are_not_cached():
+    text_analytics = make_text_analytics()
+    assert await text_analytics.key_phrase_extraction("error") is None
+    assert await text_analytics.key_phrase_extraction("error") is None
+    assert len(text_analytics.client.calls) == 2
+    assert text_analytics.stats()["errors"] == 2
+
+async def test_concurrent_extractions_share_one_request():
+    text_analytics = make_text_analytics()
+    results = await asyncio.gather(
+        text_analytics.key_phrase_extraction("eggs milk"),
+        text_analytics.key_phrase_extraction("rice"),
+        text_analytics.key_phrase_extraction("Eggs milk"),
+        text_analytics.key_phrase_extraction("an error"),
+    )
+
+    assert results == [["eggs", "milk"], ["rice"], ["eggs", "milk"], None]
+    # Repeated documents are only sent once, and one bad document doesn't fail the rest
+    assert text_analytics.client.calls == [["eggs milk", "rice", "an error"]]
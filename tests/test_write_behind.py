@@ -0,0 +1,79 @@
+from api.write_behind import WriteBehindQueue
+
+class FakeClient:
+    """
+    Records POSTs and answers each with the next status for its path (default 201).
+    """
+
+    def __init__(self, statuses=None):
+        self.statuses = {path: list(codes) for path, codes in (statuses or {}).items()}
+        self.posts = []
+
+    async def request(self, method, path, json=None):
+        self.posts.append((path, json))
+        codes = self.statuses.get(path)
+        return (codes.pop(0) if codes else 201), {}, None
+
+def make_queue(client, **kwargs):
+    return WriteBehindQueue(
+        client,
+        bulk_paths=["allergies", "preferences"],
+        single_paths=["users"],
+        backoff_seconds=0,
+        **kwargs
+    )
+
+async def test_single_rows_are_flushed_before_bulk_rows():
+    client = FakeClient()
+    queue = make_queue(client, max_batch_size=2)
+    queue.enqueue("preferences", [{"id": 1}, {"id": 2}, {"id": 3}])
+    queue.enqueue("allergies", {"allergy": "nuts"})
+    queue.enqueue("users", [{"id": "a"}, {"id": "b"}])
+    await queue.close()
+
+    assert client.posts == [
+        ("users", {"id": "a"}),
+        ("users", {"id": "b"}),
+        ("allergies", [{"allergy": "nuts"}]),
+        ("preferences", [{"id": 1}, {"id": 2}]),
+        ("preferences", [{"id": 3}]),
+    ]
+    assert queue.stats()["written_rows"] == 6
+    assert queue.stats()["pending_rows"] == 0
+
+async def test_server_errors_are_retried_and_client_errors_are_dropped():
+    client = FakeClient({"allergies": [500, 503], "preferences": [400]})
+    queue = make_queue(client, max_retries=3)
+    queue.enqueue("allergies", {"allergy": "nuts"})
+    queue.enqueue("preferences", {"id": 1})
+    await queue.close()
+
+    stats = queue.stats()
+    assert [path for path, _ in client.posts] == ["allergies"] * 3 + ["preferences"]
+    assert stats["retries"] == 2
+    assert stats["written_rows"] == 1
+    assert stats["dropped_rows"] == 1
+
+async def test_rows_are_dropped_after_the_last_retry():
+    client = FakeClient({"users": [502] * 10})
+    queue = make_queue(client, max_retries=2)
+    queue.enqueue("users", {"id": "a"})
+    await queue.close()
+
+    assert len(client.posts) == 3
+    assert queue.stats()["dropped_rows"] == 1
+
+async def test_preparers_run_in_the_flush_and_can_drop_rows():
+    client = FakeClient()
+
+    async def keep_marked(rows):
+        return [row for row in rows if row["marked"]]
+
+    queue = make_queue(client, preparers={"preferences": keep_marked})
+    queue.enqueue("preferences", [{"marked": True}, {"marked": False}])
+    # Nothing is prepared or posted until the queue flushes
+    assert client.posts == []
+    await queue.close()
+
+    assert client.posts == [("preferences", [{"marked": True}])]
+    assert queue.stats()["dropped_rows"] == 1